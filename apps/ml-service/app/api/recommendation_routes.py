@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
@@ -6,6 +7,7 @@ import uuid
 
 from app.services.recommendation_service import RecommendationService
 from app.services.kafka_producer import KafkaProducerService
+from app.services.local_cache import recommendation_cache
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +40,8 @@ async def get_recommendations(request: RecommendationRequest):
         request_id = str(uuid.uuid4())
 
         # Lấy recommendations từ ML service
-        recommendations = recommendation_service.get_recommendations_for_user(
+        # Async end-to-end: Redis qua asyncio client, model query qua batcher
+        recommendations = await recommendation_service.get_recommendations_for_user_async(
             user_id=request.user_id,
             current_product_id=request.current_product_id,
             limit=request.limit
@@ -47,8 +50,9 @@ async def get_recommendations(request: RecommendationRequest):
         # Extract chỉ product IDs
         product_ids = [rec.product_id for rec in recommendations]
 
-        # Gửi product IDs qua Kafka
-        success = kafka_producer.send_recommendations(
+        # Gửi product IDs qua Kafka (send có thể block tới max_block_ms nên chạy ngoài event loop)
+        success = await run_in_threadpool(
+            kafka_producer.send_recommendations,
             user_id=request.user_id,
             product_ids=product_ids,
             request_id=request_id
@@ -104,15 +108,19 @@ async def get_similar_products(
         request_id = str(uuid.uuid4())
 
         # Lấy similar products
-        similar = recommendation_service.get_similar_products(
+        # Thường chỉ là lookup neighbor index, nhưng fallback (product chưa có trong model)
+        # gọi gRPC đồng bộ nên vẫn chạy trong threadpool để không block event loop
+        similar = await run_in_threadpool(
+            recommendation_service.get_similar_products,
             product_id=product_id,
             limit=limit
         )
 
         product_ids = [rec.product_id for rec in similar]
 
-        # Gửi qua Kafka
-        success = kafka_producer.send_recommendations(
+        # Gửi qua Kafka (ngoài event loop)
+        success = await run_in_threadpool(
+            kafka_producer.send_recommendations,
             user_id=user_id or "anonymous",
             product_ids=product_ids,
             request_id=request_id
@@ -136,4 +144,16 @@ async def get_similar_products(
         raise HTTPException(
             status_code=500,
             detail=f"Error getting similar products: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/producer/stats")
+async def get_producer_stats():
+    """Delivered/failed/queued counters của Kafka producer"""
+    return kafka_producer.stats()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters của in-process recommendation cache"""
+    return recommendation_cache.stats()
@@ -1,42 +1,78 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from app.services.tfrs_service import TFRSRecommendationService
+from typing import Optional
+from app.services.model_registry import model_registry
+from app.services.training_worker import training_jobs, TrainingAlreadyRunning
 
 router = APIRouter()
-tfrs_service = TFRSRecommendationService()
 
 
 class TrainRequest(BaseModel):
     epochs: int = 5
+    # Warm-start từ model hiện tại, chỉ fine-tune trên interactions mới
+    incremental: bool = False
 
 
 class TrainResponse(BaseModel):
     status: str
     message: str
+    job_id: Optional[str] = None
 
 
 @router.post("/train", response_model=TrainResponse)
-async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
+async def train_model(request: TrainRequest):
     """
     Train TensorFlow Recommenders model
-    This will run in background
+    Training chạy trong process riêng, theo dõi qua /jobs/{job_id}
     """
-
-    def train_task():
-        tfrs_service.train_model(epochs=request.epochs)
-
-    background_tasks.add_task(train_task)
+    try:
+        job = training_jobs.start_job(epochs=request.epochs, incremental=request.incremental)
+    except TrainingAlreadyRunning as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Training job {e} is already running"
+        )
 
     return TrainResponse(
         status="started",
-        message=f"Model training started with {request.epochs} epochs. Running in background."
+        message=(
+            f"{'Incremental' if request.incremental else 'Full'} model training started "
+            f"with {request.epochs} epochs. Running in a separate process."
+        ),
+        job_id=job['job_id']
     )
 
 
+@router.get("/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """
+    Progress của training job: epoch, loss, elapsed time, examples/sec
+    Job state chỉ có trên worker đã start job, worker/replica khác trả về 404
+    """
+    job = training_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str):
+    """Cancel training job đang chạy (chỉ trên worker đã start job)"""
+    if not training_jobs.get_job(job_id):
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+
+    if not training_jobs.cancel_job(job_id):
+        raise HTTPException(status_code=409, detail=f"Training job {job_id} is not running")
+
+    return training_jobs.get_job(job_id)
+
+
 @router.get("/model/status")
 async def get_model_status():
     """Get model training status"""
     return {
-        "is_trained": tfrs_service.model.is_trained,
-        "model_path": tfrs_service.model_path
-    }
\ No newline at end of file
+        "is_trained": model_registry.model.is_trained,
+        "model_version": model_registry.version,
+        "model_path": model_registry.model_path,
+        "training_job": training_jobs.active_job()
+    }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -8,11 +8,26 @@ class Settings(BaseSettings):
     kafka_topic_product_view: str = "product.view"
     kafka_topic_recommendations: str = "product.recommendations"
     kafka_group_id: str = "ml-service-group"
+    kafka_batch_mode: bool = True
+    kafka_max_poll_records: int = 500
+    kafka_poll_timeout_ms: int = 1000
+
+    # Kafka producer
+    kafka_producer_async: bool = True  # enqueue rồi return, không chờ broker
+    kafka_producer_acks: str = "all"
+    kafka_producer_max_in_flight: int = 1
+    kafka_producer_linger_ms: int = 5
+    kafka_producer_batch_size: int = 65536
+    kafka_producer_compression_type: Optional[str] = None  # "gzip" | "snappy" | "lz4" | "zstd"
+    kafka_producer_max_block_ms: int = 1000
+    kafka_producer_max_queued: int = 10000
+    kafka_producer_enqueue_timeout_ms: int = 100
 
     # Redis
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_db: int = 2
+    redis_max_connections: int = 50
 
     # gRPC & HTTP
     grpc_port: int = 50051
@@ -20,12 +35,78 @@ class Settings(BaseSettings):
 
     # Product Service gRPC
     product_service_grpc_url: str = "product-service:50051"
+    # Thư mục chứa product.proto (relative theo apps/ml-service), None = proto/ trong image hoặc libs/proto khi dev
+    product_proto_dir: Optional[str] = None
+    product_service_timeout_s: float = 2.0  # deadline cho mỗi call
+    product_service_batch_size: int = 100  # số GetProduct đồng thời khi lấy nhiều products
+    product_cache_max_size: int = 50_000
+    product_cache_ttl_s: float = 600.0
+
+    # Product features cache trong Redis
+    product_features_storage: str = "json"  # "json" (GET/SET string) | "hash" (HSET, compact hơn)
+    product_features_ttl_s: int = 86400  # 0 = không hết hạn
+
+    # Popularity: đếm views theo time buckets (tự expire), trending được materialize định kỳ
+    popularity_bucket_s: int = 3600
+    popularity_window_buckets: int = 168  # 7 ngày với bucket 1h
+    popularity_half_life_s: int = 86400  # bucket cũ hơn half-life có trọng số 0.5
+    trending_refresh_interval_s: float = 300.0
+    trending_max_size: int = 10_000  # số products giữ trong trending set
+    trending_per_category: bool = False  # trending:cat:{id}, chỉ bật khi có caller đọc theo category
+    popular_refresh_interval_s: float = 30.0  # reload popular list trong memory
+    popular_cache_size: int = 100
 
     # Recommendation settings
     max_recommendations: int = 20
     user_history_limit: int = 50
     similarity_threshold: float = 0.3
 
+    # Model
+    model_path: str = "models/tfrs_recommender"  # artifact directory, mỗi lần train là một version
+    model_keep_versions: int = 3
+    model_reload_interval_s: float = 10.0  # serving processes poll CURRENT và reload khi có version mới
+    model_verify_checksums: bool = False  # sha256 toàn bộ arrays lúc load (đọc hết file, mất lợi thế mmap)
+    embedding_dim: int = 64
+    training_data_dir: str = "models/training_data"
+    training_shard_size: int = 1_000_000  # interactions / shard
+    training_shuffle_buffer_size: int = 100_000
+    training_batch_size: int = 2048
+    training_cancel_grace_s: float = 10.0  # sau thời gian này process bị terminate
+    training_lock_ttl_s: int = 60  # Redis lock "một training job" trên mọi workers, được gia hạn khi job chạy
+    retrieval_backend: str = "bruteforce"  # "bruteforce" | "numpy" | "ivf"
+    # "tensorflow" | "numpy": numpy serve từ exported arrays, không import TensorFlow
+    # (training process vẫn cần TensorFlow)
+    serving_mode: str = "tensorflow"
+    ivf_num_lists: int = 0  # 0 = tự chọn ~sqrt(số products)
+    ivf_num_probes: int = 16
+    exact_exclusion: bool = True  # mask products đã xem trước top-k thay vì over-fetch k * 2
+    # Fold-in: user chưa có trong model được tạo vector từ history
+    fold_in_enabled: bool = True
+    fold_in_decay: float = 0.9  # trọng số theo độ mới: decay^i
+    fold_in_history_limit: int = 20
+    item_neighbors_count: int = 50  # similar products precompute / product, 0 = tắt
+
+    # Request batching (gom requests đồng thời thành một lần query model)
+    request_batching_enabled: bool = True
+    request_batch_max_size: int = 64
+    request_batch_max_wait_ms: float = 2.0
+    request_batch_timeout_s: float = 5.0
+
+    # Recommendation cache (key có model version nên có thể để TTL dài)
+    recommendation_cache_ttl_s: int = 3600
+
+    # In-process cache trước Redis recommendation cache
+    local_cache_enabled: bool = True
+    local_cache_max_size: int = 100_000  # số users
+    local_cache_ttl_s: float = 30.0
+
+    # Precompute recommendations sau mỗi lần train
+    precompute_after_training: bool = True
+    precompute_active_window_s: int = 7 * 86400  # users có view trong khoảng này
+    precompute_batch_size: int = 1024  # users / lần query model
+    precompute_limit: int = 20  # số recommendations lưu cho mỗi user
+    precompute_cache_ttl_s: int = 86400
+
     class Config:
         env_file = ".env"
         case_sensitive = False
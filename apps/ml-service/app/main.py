@@ -7,6 +7,11 @@ from app.api.training_routes import router as training_router
 from app.api.recommendation_routes import router as recommendation_router
 from app.services.kafka_consumer import KafkaConsumerService
 from app.services.event_handler import ProductViewEventHandler
+from app.services.async_redis_service import close_async_connection_pool
+from app.services.product_service_client import close_channel
+from app.services.popularity_service import popularity_refresher
+from app.services.cache_invalidation import cache_invalidation_listener
+from app.services.model_registry import model_registry
 from app.config import settings
 
 # Configure logging
@@ -55,7 +60,8 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "kafka_consumer": "running" if kafka_consumer and kafka_consumer.running else "stopped"
+        "kafka_consumer": "running" if kafka_consumer and kafka_consumer.running else "stopped",
+        "kafka_producer": event_handler.kafka_producer.stats() if event_handler else None
     }
 
 
@@ -67,6 +73,16 @@ async def startup_event():
     """
     global kafka_consumer, event_handler, consumer_thread
 
+    # Materialize trending định kỳ cho popular fallback
+    popularity_refresher.start()
+
+    # Reload model khi training job (ở process/replica khác) publish version mới
+    model_registry.start_watching(settings.model_reload_interval_s)
+
+    # Xoá in-process recommendation cache khi process khác xử lý view event của user
+    if settings.local_cache_enabled:
+        cache_invalidation_listener.start()
+
     try:
         logger.info("Starting Kafka consumer...")
 
@@ -82,6 +98,10 @@ async def startup_event():
             settings.kafka_topic_product_view,
             event_handler.handle_product_viewed
         )
+        kafka_consumer.register_batch_handler(
+            settings.kafka_topic_product_view,
+            event_handler.handle_product_viewed_batch
+        )
 
         # Start consumer trong background thread
         consumer_thread = threading.Thread(
@@ -108,9 +128,16 @@ async def shutdown_event():
     if kafka_consumer:
         kafka_consumer.stop()
 
+    popularity_refresher.stop()
+    model_registry.stop_watching()
+    cache_invalidation_listener.stop()
+
     if event_handler:
         event_handler.close()
 
+    await close_async_connection_pool()
+    close_channel()
+
     logger.info("Shutdown complete")
 
 
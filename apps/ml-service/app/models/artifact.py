@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+ARTIFACT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+
+class ArtifactError(Exception):
+    """Artifact thiếu file, sai format hoặc sai checksum"""
+
+
+def _sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def current_version(root: str) -> Optional[str]:
+    """Version đang được CURRENT trỏ tới, None nếu chưa có artifact nào"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ArtifactWriter:
+    """
+    Ghi model artifact vào một version directory mới
+
+    Layout: {root}/{version}/
+        manifest.json      - format, metadata, shape/dtype/sha256 của từng file
+        {name}.txt         - string lists (vocabularies, candidate ids), mỗi dòng một token
+        {name}.npy         - arrays (raw .npy, load lại bằng mmap, không pickle)
+        {extra dirs}       - vd: Keras towers cho training
+
+    Files được ghi vào staging directory, commit() rename sang {root}/{version}
+    rồi mới đổi CURRENT (atomic), process khác không bao giờ thấy artifact ghi dở
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+        self.staging_dir = os.path.join(root, f".staging-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(self.staging_dir)
+
+        self.arrays: Dict[str, Dict] = {}
+        self.strings: Dict[str, Dict] = {}
+
+    def path(self, *parts: str) -> str:
+        """Path trong staging directory (cho files không qua add_*, vd: SavedModel)"""
+        return os.path.join(self.staging_dir, *parts)
+
+    def add_array(self, name: str, array: np.ndarray):
+        array = np.asarray(array)
+        if array.dtype == object:
+            raise ArtifactError(f"Array '{name}' has object dtype and cannot be saved without pickle")
+
+        filename = f"{name}.npy"
+        np.save(self.path(filename), array, allow_pickle=False)
+        self.arrays[name] = {
+            'file': filename,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'sha256': _sha256(self.path(filename))
+        }
+
+    def add_strings(self, name: str, values: Sequence[str]):
+        values = [str(value) for value in values]
+        if any('\n' in value or '\r' in value for value in values):
+            raise ArtifactError(f"String list '{name}' contains line breaks")
+
+        filename = f"{name}.txt"
+        with open(self.path(filename), 'w', encoding='utf-8', newline='\n') as f:
+            for value in values:
+                f.write(value)
+                f.write('\n')
+
+        self.strings[name] = {
+            'file': filename,
+            'count': len(values),
+            'sha256': _sha256(self.path(filename))
+        }
+
+    def commit(self, metadata: Dict, version: Optional[str] = None) -> str:
+        """Ghi manifest, publish version directory và trỏ CURRENT tới nó. Returns: version"""
+        version = version or time.strftime("%Y%m%d%H%M%S", time.gmtime())
+        # Hai lần save trong cùng một giây
+        base, suffix = version, 1
+        while os.path.exists(os.path.join(self.root, version)):
+            version = f"{base}-{suffix}"
+            suffix += 1
+
+        manifest = {
+            'format': ARTIFACT_FORMAT,
+            'version': version,
+            'created_at': int(time.time()),
+            'metadata': metadata,
+            'arrays': self.arrays,
+            'strings': self.strings
+        }
+        with open(self.path(MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(self.staging_dir, os.path.join(self.root, version))
+
+        pointer = os.path.join(self.root, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(self.root, CURRENT_FILE))
+
+        return version
+
+    def abort(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+class ModelArtifact:
+    """
+    Artifact đã publish, đọc theo manifest
+
+    Arrays được load bằng mmap (chỉ đọc pages khi dùng tới), shape/dtype luôn
+    được kiểm tra với manifest, sha256 chỉ kiểm tra khi verify_checksums
+    (phải đọc hết file nên mất lợi thế của mmap)
+    """
+
+    def __init__(self, root: str, version: Optional[str] = None, verify_checksums: bool = False):
+        version = version or current_version(root)
+        if version is None:
+            raise ArtifactError(f"No model artifact found in {root}")
+
+        self.version = version
+        self.directory = os.path.join(root, version)
+        self.verify_checksums = verify_checksums
+
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise ArtifactError(f"Model artifact {version} has no manifest")
+
+        if self.manifest.get('format') != ARTIFACT_FORMAT:
+            raise ArtifactError(f"Unsupported artifact format: {self.manifest.get('format')}")
+
+    @property
+    def metadata(self) -> Dict:
+        return self.manifest['metadata']
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def has_array(self, name: str) -> bool:
+        return name in self.manifest['arrays']
+
+    def _verify(self, name: str, entry: Dict):
+        if self.verify_checksums and _sha256(self.path(entry['file'])) != entry['sha256']:
+            raise ArtifactError(f"Checksum mismatch for '{name}' in model artifact {self.version}")
+
+    def array(self, name: str, mmap: bool = True) -> np.ndarray:
+        entry = self.manifest['arrays'].get(name)
+        if entry is None:
+            raise ArtifactError(f"Array '{name}' not found in model artifact {self.version}")
+
+        self._verify(name, entry)
+        array = np.load(self.path(entry['file']), mmap_mode='r' if mmap else None, allow_pickle=False)
+
+        if list(array.shape) != entry['shape'] or array.dtype.str != entry['dtype']:
+            raise ArtifactError(
+                f"Array '{name}' is {array.dtype.str}{list(array.shape)}, "
+                f"manifest says {entry['dtype']}{entry['shape']}"
+            )
+        return array
+
+    def strings(self, name: str) -> List[str]:
+        entry = self.manifest['strings'].get(name)
+        if entry is None:
+            raise ArtifactError(f"String list '{name}' not found in model artifact {self.version}")
+
+        self._verify(name, entry)
+        with open(self.path(entry['file']), encoding='utf-8', newline='\n') as f:
+            values = f.read().split('\n')[:-1]
+
+        if len(values) != entry['count']:
+            raise ArtifactError(f"String list '{name}' has {len(values)} entries, manifest says {entry['count']}")
+        return values
+
+
+def prune_versions(root: str, keep: int):
+    """Xoá các version cũ, giữ lại keep versions mới nhất (luôn giữ CURRENT)"""
+    current = current_version(root)
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith('.') and os.path.isfile(os.path.join(root, name, MANIFEST_FILE))
+    )
+
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version == current:
+            continue
+        # Process đang mmap version cũ vẫn đọc được (file chỉ thực sự bị xoá khi hết reference)
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        logger.info(f"Removed old model artifact {version}")
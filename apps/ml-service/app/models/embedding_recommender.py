@@ -0,0 +1,365 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.artifact import ModelArtifact
+from app.models.retrieval import Exclusions, IVFTopKIndex, NumpyTopKIndex
+
+logger = logging.getLogger(__name__)
+
+# OOV token của StringLookup (row 0 của user embedding table)
+OOV_TOKEN = "[UNK]"
+VOCABULARY_NAMES = ('user_id', 'product_id', 'category_id', 'brand_id')
+
+
+class EmbeddingRecommender:
+    """
+    Serving model chỉ dùng NumPy, không import TensorFlow
+
+    Load exported arrays từ model artifact (user embedding table, candidate embeddings,
+    IVF index, item neighbors) và serve recommendations bằng lookup + matmul.
+    ProductRecommender (tfrs_model.py) kế thừa class này và thêm training bằng TFRS
+
+    retrieval_backend:
+    - "numpy": NumpyTopKIndex (exact)
+    - "ivf": IVFTopKIndex (approximate, cho catalog lớn)
+    """
+
+    RETRIEVAL_BACKENDS = ("numpy", "ivf")
+
+    def __init__(
+        self,
+        embedding_dim: int = 32,
+        retrieval_backend: str = "numpy",
+        ivf_num_lists: int = 0,
+        ivf_num_probes: int = 16,
+        fold_in_decay: float = 0.9,
+        fold_in_history_limit: int = 20,
+        num_item_neighbors: int = 50,
+        exact_exclusion: bool = True
+    ):
+        if retrieval_backend not in self.RETRIEVAL_BACKENDS:
+            raise ValueError(f"Unknown retrieval backend: {retrieval_backend}")
+
+        self.embedding_dim = embedding_dim
+        self.retrieval_backend = retrieval_backend
+        self.ivf_num_lists = ivf_num_lists
+        self.ivf_num_probes = ivf_num_probes
+        self.fold_in_decay = fold_in_decay
+        self.fold_in_history_limit = fold_in_history_limit
+        self.num_item_neighbors = num_item_neighbors
+        # True: filter_products được mask trước top-k, luôn trả về đủ k products chưa xem
+        # False: query k rồi lọc sau (caller phải tự over-fetch)
+        self.exact_exclusion = exact_exclusion
+        self.user_index = None
+        self.item_index = None
+
+        # User tower embedding table (vocab_size x embedding_dim), row 0 là OOV
+        self.user_embeddings: Optional[np.ndarray] = None
+
+        # Precomputed item tower outputs (N x embedding_dim) và product ids tương ứng
+        self.candidate_embeddings: Optional[np.ndarray] = None
+        self.candidate_ids: Optional[np.ndarray] = None
+        # Features của candidates (cùng thứ tự candidate_ids), dùng khi warm-start
+        self.candidate_categories: Optional[np.ndarray] = None
+        self.candidate_brands: Optional[np.ndarray] = None
+
+        # Item-to-item neighbors (N x num_item_neighbors), index vào candidate_ids
+        self.item_neighbors: Optional[np.ndarray] = None
+        self.item_neighbor_scores: Optional[np.ndarray] = None
+
+        # Lookups dùng cho fold-in và similar products (build cùng retrieval index)
+        self.candidate_lookup: Dict[str, int] = {}
+        self.user_lookup: Dict[str, int] = {}
+
+        # Vocabularies (không gồm OOV token) theo feature name
+        self._vocabularies: Optional[Dict[str, List[str]]] = None
+
+        # Keras towers đã save trong artifact, chỉ training (warm-start) mới cần
+        self.towers_path: Optional[str] = None
+
+        self.is_trained = False
+        # Thời điểm (epoch seconds) lấy training data, incremental training chỉ
+        # dùng interactions sau thời điểm này
+        self.trained_at: Optional[int] = None
+
+    def vocabularies(self) -> Dict[str, List[str]]:
+        """Vocabularies hiện tại (không gồm OOV token), theo feature name"""
+        return self._vocabularies or {}
+
+    def candidate_products(self) -> List[Dict]:
+        """Catalog mà model đang index, dạng [{'id', 'category_id', 'brand_id'}, ...]"""
+        if self.candidate_ids is None:
+            return []
+
+        categories = self.candidate_categories if self.candidate_categories is not None else [''] * len(self.candidate_ids)
+        brands = self.candidate_brands if self.candidate_brands is not None else [''] * len(self.candidate_ids)
+
+        return [
+            {'id': str(product_id), 'category_id': str(category_id), 'brand_id': str(brand_id)}
+            for product_id, category_id, brand_id in zip(self.candidate_ids, categories, brands)
+        ]
+
+    def _build_index(self, ivf_centroids: Optional[np.ndarray] = None, ivf_assignments: Optional[np.ndarray] = None):
+        """
+        Build retrieval index từ candidate embeddings đã precompute
+        IVF có thể dùng lại centroids/assignments đã lưu thay vì chạy lại k-means
+        """
+        self.candidate_lookup = {str(pid): row for row, pid in enumerate(self.candidate_ids)}
+        self._build_index_backend(ivf_centroids, ivf_assignments)
+
+        if isinstance(self.item_index, NumpyTopKIndex):
+            self.user_lookup = self.item_index.user_lookup
+        else:
+            self.user_lookup = {user_id: idx for idx, user_id in enumerate(self._user_vocabulary())}
+
+    def _user_vocabulary(self) -> List[str]:
+        """User vocabulary theo đúng rows của user_embeddings (gồm OOV token ở row 0)"""
+        return [OOV_TOKEN] + list(self.vocabularies()['user_id'])
+
+    def _build_index_backend(self, ivf_centroids: Optional[np.ndarray], ivf_assignments: Optional[np.ndarray]):
+        if self.retrieval_backend == "ivf":
+            self.item_index = IVFTopKIndex(
+                user_vocabulary=self._user_vocabulary(),
+                user_embeddings=self.user_embeddings,
+                candidate_ids=self.candidate_ids,
+                candidate_embeddings=self.candidate_embeddings,
+                num_lists=self.ivf_num_lists,
+                num_probes=self.ivf_num_probes,
+                centroids=ivf_centroids,
+                assignments=ivf_assignments
+            )
+            return
+
+        self.item_index = NumpyTopKIndex(
+            user_vocabulary=self._user_vocabulary(),
+            user_embeddings=self.user_embeddings,
+            candidate_ids=self.candidate_ids,
+            candidate_embeddings=self.candidate_embeddings
+        )
+
+    def _query_index(
+        self,
+        user_ids: List[str],
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Query index với backend đang dùng
+        exclude: candidate rows bị loại theo từng user (mask trước top-k)
+        Returns: (scores, product_ids) dạng NumPy, shape (B x k)
+        """
+        return self.item_index.query(user_ids, k, exclude)
+
+    def _query_vectors(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Query index bằng user vectors có sẵn (B x d) thay vì user ids"""
+        return self.item_index.query_vectors(queries, k, exclude)
+
+    def _candidate_rows(self, product_ids: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        """Product ids -> rows trong candidate_ids (bỏ products không có trong catalog)"""
+        if not product_ids:
+            return None
+
+        rows = [self.candidate_lookup[pid] for pid in product_ids if pid in self.candidate_lookup]
+        return np.array(rows, dtype=np.int64) if rows else None
+
+    def fold_in_vectors(self, histories: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tạo user vectors từ history (recent first) mà không cần train lại:
+        trung bình item embeddings của fold_in_history_limit views gần nhất,
+        trọng số fold_in_decay^i theo độ mới
+        Returns: (vectors B x d, mask B) - mask False nếu history không có product nào trong catalog
+        """
+        vectors = np.zeros((len(histories), self.candidate_embeddings.shape[1]), dtype=np.float32)
+        mask = np.zeros(len(histories), dtype=bool)
+
+        for row, history in enumerate(histories):
+            rows = [
+                self.candidate_lookup[product_id]
+                for product_id in history[:self.fold_in_history_limit]
+                if product_id in self.candidate_lookup
+            ]
+            if not rows:
+                continue
+
+            weights = self.fold_in_decay ** np.arange(len(rows), dtype=np.float32)
+            vectors[row] = weights @ self.candidate_embeddings[rows] / weights.sum()
+            mask[row] = True
+
+        return vectors, mask
+
+    def recommend(
+        self,
+        user_id: str,
+        k: int = 10,
+        filter_products: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Get recommendations for user
+        Returns: [(product_id, score), ...]
+        """
+        return self.recommend_batch([user_id], k=k, filter_products=[filter_products])[0]
+
+    def recommend_batch(
+        self,
+        user_ids: List[str],
+        k: int = 10,
+        filter_products: Optional[List[Optional[List[str]]]] = None,
+        histories: Optional[List[Optional[List[str]]]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Get recommendations cho nhiều users trong một lần query index (B x N matmul)
+        filter_products: danh sách products cần loại bỏ, theo từng user
+        histories: history (recent first) theo từng user, user chưa có trong vocabulary
+            (đăng ký sau lần train cuối) được fold-in từ history thay vì dùng OOV row
+        Returns: [[(product_id, score), ...], ...] theo thứ tự user_ids
+        """
+        if not self.is_trained or self.item_index is None:
+            logger.warning("Model not trained yet")
+            return [[] for _ in user_ids]
+
+        try:
+            # Exact exclusion: products đã xem bị mask trước top-k nên không cần over-fetch
+            exclude = None
+            if filter_products and self.exact_exclusion:
+                exclude = [self._candidate_rows(products) for products in filter_products]
+
+            # Get recommendations
+            scores, product_ids = self._query_index(user_ids, k, exclude)
+
+            if histories:
+                scores, product_ids = self._apply_fold_in(user_ids, histories, scores, product_ids, k, exclude)
+
+            # Convert to list
+            results = []
+            for row in range(len(user_ids)):
+                excluded = filter_products[row] if filter_products else None
+
+                recommendations = []
+                for product_id, score in zip(product_ids[row], scores[row]):
+                    product_id_str = str(product_id)
+
+                    # -inf: không đủ candidates sau khi mask
+                    if not np.isfinite(score):
+                        continue
+
+                    # Filter if needed
+                    if excluded and product_id_str in excluded:
+                        continue
+
+                    recommendations.append((product_id_str, float(score)))
+
+                results.append(recommendations)
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error getting recommendations: {e}", exc_info=True)
+            return [[] for _ in user_ids]
+
+    def similar_products(self, product_id: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Similar products từ neighbor index đã precompute (cosine giữa item embeddings)
+        Returns: [(product_id, score), ...], rỗng nếu product không có trong catalog
+        """
+        if self.item_neighbors is None:
+            return []
+
+        row = self.candidate_lookup.get(product_id)
+        if row is None:
+            return []
+
+        neighbors = self.item_neighbors[row, :k]
+        scores = self.item_neighbor_scores[row, :k]
+        return [
+            (str(self.candidate_ids[idx]), float(score))
+            for idx, score in zip(neighbors, scores)
+        ]
+
+    def _apply_fold_in(
+        self,
+        user_ids: List[str],
+        histories: List[Optional[List[str]]],
+        scores: np.ndarray,
+        product_ids: np.ndarray,
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Thay kết quả của users ngoài vocabulary bằng kết quả query từ fold-in vectors
+        Fold-in vector gần nhất với chính các products trong history nên history
+        luôn bị mask (cùng với exclude của user đó)
+        Returns: (scores, product_ids) dạng list theo từng user
+        """
+        rows = [
+            row for row, user_id in enumerate(user_ids)
+            if user_id not in self.user_lookup and histories[row]
+        ]
+        if not rows:
+            return scores, product_ids
+
+        vectors, mask = self.fold_in_vectors([histories[row] for row in rows])
+        rows = [row for row, ok in zip(rows, mask) if ok]
+        if not rows:
+            return scores, product_ids
+
+        fold_exclude = []
+        for row in rows:
+            seen = self._candidate_rows(histories[row])
+            if exclude is not None and exclude[row] is not None:
+                seen = np.union1d(seen, exclude[row])
+            fold_exclude.append(seen)
+
+        fold_scores, fold_ids = self._query_vectors(vectors[mask], k, fold_exclude)
+
+        scores = list(scores)
+        product_ids = list(product_ids)
+        for row, row_scores, row_ids in zip(rows, fold_scores, fold_ids):
+            scores[row] = row_scores
+            product_ids[row] = row_ids
+        return scores, product_ids
+
+    def load(self, path: str, verify_checksums: bool = False) -> Optional[str]:
+        """
+        Load model từ artifact mới nhất trong path (xem ArtifactWriter)
+        Arrays được mmap, Keras towers không được load
+        Returns: version của artifact
+        """
+        artifact = ModelArtifact(path, verify_checksums=verify_checksums)
+        logger.info(f"Loading model artifact {artifact.version} from {path}")
+
+        metadata = artifact.metadata
+        self.embedding_dim = metadata['embedding_dim']
+        self.is_trained = metadata['is_trained']
+        self.trained_at = metadata.get('trained_at')
+
+        self._vocabularies = {name: artifact.strings(f"vocab_{name}") for name in VOCABULARY_NAMES}
+        self.towers_path = artifact.path("towers")
+
+        self.user_embeddings = artifact.array("user_embeddings")
+        self.candidate_embeddings = artifact.array("candidate_embeddings")
+        self.candidate_ids = np.array(artifact.strings("candidate_ids"))
+        self.candidate_categories = np.array(artifact.strings("candidate_categories"))
+        self.candidate_brands = np.array(artifact.strings("candidate_brands"))
+
+        ivf_centroids = None
+        ivf_assignments = None
+        if self.retrieval_backend == "ivf" and artifact.has_array("ivf_centroids"):
+            ivf_centroids = artifact.array("ivf_centroids", mmap=False)
+            ivf_assignments = artifact.array("ivf_assignments", mmap=False)
+
+        self._build_index(ivf_centroids, ivf_assignments)
+        logger.info(f"Rebuilt retrieval index with {len(self.candidate_ids)} candidates")
+
+        if artifact.has_array("item_neighbors"):
+            self.item_neighbors = artifact.array("item_neighbors")
+            self.item_neighbor_scores = artifact.array("item_neighbor_scores")
+
+        logger.info("Model loaded successfully")
+        return artifact.version
@@ -0,0 +1,265 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Theo từng query: candidate indices (rows của candidate_ids) cần loại, None = không loại
+Exclusions = Optional[Sequence[Optional[np.ndarray]]]
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k theo từng hàng của ma trận scores (B x N)
+    Returns: (top_scores, top_indices), đã sort giảm dần giống tf.math.top_k
+    """
+    num_candidates = scores.shape[1]
+    k = min(k, num_candidates)
+
+    if k < num_candidates:
+        # argpartition O(N) để lấy k phần tử lớn nhất (chưa sort)
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        # Sort theo index trước để tie-break giống tf.math.top_k (index nhỏ trước)
+        candidates.sort(axis=1)
+    else:
+        candidates = np.tile(np.arange(num_candidates), (scores.shape[0], 1))
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+
+    top_indices = np.take_along_axis(candidates, order, axis=1)
+    top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+    return top_scores, top_indices
+
+
+def mask_scores(scores: np.ndarray, exclude: Exclusions):
+    """Gán -inf cho scores của candidates bị loại (in-place) để top-k không chọn chúng"""
+    if exclude is None:
+        return
+
+    for row, rows in enumerate(exclude):
+        if rows is not None and len(rows):
+            scores[row, rows] = -np.inf
+
+
+class NumpyTopKIndex:
+    """
+    Retrieval engine thuần NumPy
+
+    Export user embedding table và candidate embeddings của model ra NumPy,
+    mỗi query chỉ là lookup + matmul + argpartition, không qua TF eager dispatch
+    """
+
+    def __init__(
+        self,
+        user_vocabulary: Sequence[str],
+        user_embeddings: np.ndarray,
+        candidate_ids: np.ndarray,
+        candidate_embeddings: np.ndarray
+    ):
+        # Row 0 là OOV token của StringLookup, user lạ sẽ map về đó
+        self.user_lookup: Dict[str, int] = {
+            user_id: idx for idx, user_id in enumerate(user_vocabulary)
+        }
+        self.user_embeddings = np.ascontiguousarray(user_embeddings, dtype=np.float32)
+        self.candidate_ids = np.asarray(candidate_ids)
+        # Lưu dạng (d x N) để matmul không phải transpose mỗi request
+        self.candidate_embeddings_t = np.ascontiguousarray(
+            np.asarray(candidate_embeddings, dtype=np.float32).T
+        )
+
+    def __len__(self) -> int:
+        return len(self.candidate_ids)
+
+    def user_vectors(self, user_ids: List[str]) -> np.ndarray:
+        """Lookup user embeddings (B x d)"""
+        rows = [self.user_lookup.get(user_id, 0) for user_id in user_ids]
+        return self.user_embeddings[rows]
+
+    def query_vectors(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k candidates cho các query vectors (B x d)
+        exclude: candidates bị loại theo từng query (mask score trước top-k)
+        Returns: (scores, product_ids) cùng shape (B x k), nếu không đủ k candidates
+            sau khi loại thì phần thiếu có score -inf
+        """
+        scores = queries @ self.candidate_embeddings_t
+        mask_scores(scores, exclude)
+        top_scores, top_indices = top_k(scores, k)
+        return top_scores, self.candidate_ids[top_indices]
+
+    def query(self, user_ids: List[str], k: int, exclude: Exclusions = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k candidates cho danh sách user ids"""
+        return self.query_vectors(self.user_vectors(user_ids), k, exclude)
+
+
+def kmeans(
+    data: np.ndarray,
+    num_clusters: int,
+    num_iterations: int = 15,
+    sample_size: int = 256,
+    seed: int = 42
+) -> np.ndarray:
+    """
+    K-means đơn giản bằng NumPy để tìm centroids cho IVF
+    Chỉ train trên sample (sample_size điểm / cluster) để build nhanh với catalog lớn
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = min(len(data), num_clusters * sample_size)
+    sample = data[rng.choice(len(data), num_samples, replace=False)]
+
+    centroids = sample[rng.choice(num_samples, num_clusters, replace=False)].copy()
+
+    for _ in range(num_iterations):
+        assignments = assign_clusters(sample, centroids)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=num_clusters)
+
+        # Cluster rỗng giữ nguyên centroid cũ
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+    return centroids
+
+
+def assign_clusters(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Gán mỗi vector về centroid gần nhất (L2), xử lý theo chunk để giới hạn memory"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(data), dtype=np.int32)
+
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, bỏ ||x||^2 vì không đổi theo c
+        distances = centroid_norms - 2 * chunk @ centroids.T
+        assignments[start:start + chunk_size] = distances.argmin(axis=1)
+
+    return assignments
+
+
+class IVFTopKIndex(NumpyTopKIndex):
+    """
+    Approximate nearest-neighbour index (IVF - inverted file)
+
+    - Candidates được chia thành num_lists cluster bằng k-means
+    - Query chỉ score candidates trong num_probes cluster có centroid gần nhất
+    - Chi phí mỗi query ~ num_probes / num_lists so với brute force
+    """
+
+    def __init__(
+        self,
+        user_vocabulary: Sequence[str],
+        user_embeddings: np.ndarray,
+        candidate_ids: np.ndarray,
+        candidate_embeddings: np.ndarray,
+        num_lists: int = 0,
+        num_probes: int = 16,
+        centroids: np.ndarray = None,
+        assignments: np.ndarray = None
+    ):
+        super().__init__(user_vocabulary, user_embeddings, candidate_ids, candidate_embeddings)
+
+        embeddings = np.asarray(candidate_embeddings, dtype=np.float32)
+
+        if centroids is None:
+            # Mặc định ~ sqrt(N) lists
+            num_lists = num_lists or max(1, int(np.sqrt(len(embeddings))))
+            centroids = kmeans(embeddings, min(num_lists, len(embeddings)))
+        if assignments is None:
+            assignments = assign_clusters(embeddings, centroids)
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.num_probes = min(num_probes, len(self.centroids))
+
+        # Sắp xếp candidates theo list để mỗi list là một đoạn liên tục
+        order = np.argsort(self.assignments, kind='stable')
+        self.list_order = order
+        self.list_embeddings = np.ascontiguousarray(embeddings[order])
+        self.list_offsets = np.concatenate(([0], np.cumsum(
+            np.bincount(self.assignments, minlength=len(self.centroids))
+        )))
+
+        # IVF không cần ma trận (d x N) đầy đủ của brute force
+        self.candidate_embeddings_t = None
+
+    def query_vectors(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (xấp xỉ) cho các query vectors (B x d), exclude như NumpyTopKIndex"""
+        k = min(k, len(self.candidate_ids))
+        centroid_scores = queries @ self.centroids.T
+        list_sizes = np.diff(self.list_offsets)
+
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_ids = np.empty((len(queries), k), dtype=self.candidate_ids.dtype)
+
+        for row, query in enumerate(queries):
+            excluded = exclude[row] if exclude is not None else None
+            num_excluded = len(excluded) if excluded is not None else 0
+
+            ranked_lists = np.argsort(-centroid_scores[row])
+
+            # Probe ít nhất num_probes lists, probe thêm nếu chưa đủ k candidates (sau khi loại)
+            cumulative = np.cumsum(list_sizes[ranked_lists])
+            num_probes = max(self.num_probes, int(np.searchsorted(cumulative, k + num_excluded)) + 1)
+
+            positions = np.concatenate([
+                np.arange(self.list_offsets[i], self.list_offsets[i + 1])
+                for i in ranked_lists[:num_probes]
+            ])
+            candidates = self.list_order[positions]
+
+            scores = self.list_embeddings[positions] @ query
+            if num_excluded:
+                scores[np.isin(candidates, excluded)] = -np.inf
+            top_scores, top_positions = top_k(scores[None, :], k)
+
+            all_scores[row] = top_scores[0]
+            all_ids[row] = self.candidate_ids[candidates[top_positions[0]]]
+
+        return all_scores, all_ids
+
+
+def compute_item_neighbors(
+    embeddings: np.ndarray,
+    num_neighbors: int,
+    max_block_elements: int = 1 << 26
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top num_neighbors products giống nhất (cosine) cho từng product, không tính chính nó
+    Tính theo từng block hàng để ma trận scores không vượt quá max_block_elements
+    Returns: (neighbor_indices N x n int32, neighbor_scores N x n float32)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    num_items = len(embeddings)
+    num_neighbors = min(num_neighbors, num_items - 1)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+    normalized_t = np.ascontiguousarray(normalized.T)
+
+    indices = np.empty((num_items, max(num_neighbors, 0)), dtype=np.int32)
+    scores = np.empty((num_items, max(num_neighbors, 0)), dtype=np.float32)
+    if num_neighbors <= 0:
+        return indices, scores
+
+    block_size = max(1, max_block_elements // num_items)
+    for start in range(0, num_items, block_size):
+        end = min(start + block_size, num_items)
+        block_scores = normalized[start:end] @ normalized_t
+
+        # Loại chính product đó khỏi neighbors
+        block_scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top_scores, top_indices = top_k(block_scores, num_neighbors)
+        indices[start:end] = top_indices
+        scores[start:end] = top_scores
+
+    return indices, scores
@@ -1,9 +1,13 @@
 import tensorflow as tf
 import tensorflow_recommenders as tfrs
 import numpy as np
-import pickle
 import logging
-from typing import Dict, List, Optional, Tuple
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from app.models.artifact import ArtifactWriter, prune_versions
+from app.models.embedding_recommender import EmbeddingRecommender
+from app.models.retrieval import Exclusions, compute_item_neighbors, mask_scores, top_k
 
 logger = logging.getLogger(__name__)
 
@@ -30,42 +34,145 @@ class TwoTowerRecommenderModel(tfrs.Model):
     def compute_loss(self, features: Dict[str, tf.Tensor], training=False) -> tf.Tensor:
         """Compute loss during training"""
         user_embeddings = self.user_model(features["user_id"])
-        item_embeddings = self.item_model(features["product_id"])
+        item_embeddings = self.item_model({
+            "product_id": features["product_id"],
+            "category_id": features["category_id"],
+            "brand_id": features["brand_id"]
+        })
 
         return self.task(user_embeddings, item_embeddings)
 
 
-class ProductRecommender:
+class ProductRecommender(EmbeddingRecommender):
     """
     TensorFlow Recommenders model cho product recommendations
-    Sử dụng Two-Tower architecture
+    Sử dụng Two-Tower architecture, serving kế thừa từ EmbeddingRecommender
+
+    retrieval_backend:
+    - "bruteforce": tfrs.layers.factorized_top_k.BruteForce
+    - "numpy": NumpyTopKIndex (lookup + matmul thuần NumPy, nhanh hơn cho single-user query)
+    - "ivf": IVFTopKIndex (approximate, cho catalog lớn)
     """
 
-    def __init__(self, embedding_dim: int = 32):
-        self.embedding_dim = embedding_dim
-        self.model: Optional[TwoTowerRecommenderModel] = None
-        self.user_index = None
-        self.item_index = None
+    RETRIEVAL_BACKENDS = ("bruteforce", "numpy", "ivf")
+
+    def __init__(
+        self,
+        embedding_dim: int = 32,
+        retrieval_backend: str = "bruteforce",
+        ivf_num_lists: int = 0,
+        ivf_num_probes: int = 16,
+        fold_in_decay: float = 0.9,
+        fold_in_history_limit: int = 20,
+        num_item_neighbors: int = 50,
+        exact_exclusion: bool = True
+    ):
+        super().__init__(
+            embedding_dim=embedding_dim,
+            retrieval_backend=retrieval_backend,
+            ivf_num_lists=ivf_num_lists,
+            ivf_num_probes=ivf_num_probes,
+            fold_in_decay=fold_in_decay,
+            fold_in_history_limit=fold_in_history_limit,
+            num_item_neighbors=num_item_neighbors,
+            exact_exclusion=exact_exclusion
+        )
+
+        # Keras towers: load lazily từ towers_path (chỉ training và bruteforce backend cần)
+        self._model: Optional[TwoTowerRecommenderModel] = None
+        self._towers_lock = threading.Lock()
 
-        # Vocabularies
+        # StringLookup layers, chỉ có khi train (model load từ artifact dùng vocabulary lists)
         self.user_ids_vocabulary = None
         self.product_ids_vocabulary = None
         self.category_vocabulary = None
         self.brand_vocabulary = None
 
-        self.is_trained = False
+    @property
+    def model(self) -> Optional[TwoTowerRecommenderModel]:
+        """Keras towers, load từ artifact ở lần dùng đầu tiên"""
+        if self._model is None and self.towers_path is not None:
+            with self._towers_lock:
+                if self._model is None:
+                    self._model = self._load_towers(self.towers_path)
+        return self._model
+
+    @model.setter
+    def model(self, model: Optional[TwoTowerRecommenderModel]):
+        self._model = model
+
+    @staticmethod
+    def _load_towers(path: str) -> TwoTowerRecommenderModel:
+        logger.info(f"Loading Keras towers from {path}")
+        return TwoTowerRecommenderModel(
+            user_model=tf.keras.models.load_model(os.path.join(path, "user_model")),
+            item_model=tf.keras.models.load_model(os.path.join(path, "item_model")),
+            task=tfrs.tasks.Retrieval()
+        )
 
-    def build_user_model(self, user_ids: List[str]) -> tf.keras.Model:
+    @classmethod
+    def _towers_of(cls, recommender: EmbeddingRecommender) -> TwoTowerRecommenderModel:
+        """Keras towers của một model đã train (load từ towers_path nếu là serving model)"""
+        if isinstance(recommender, ProductRecommender) and recommender.model is not None:
+            return recommender.model
+
+        if recommender.towers_path is None:
+            raise ValueError("Warm-start model has no saved Keras towers")
+        return cls._load_towers(recommender.towers_path)
+
+    @staticmethod
+    def _make_vocabulary(
+        values: Union[List[str], tf.data.Dataset],
+        base_vocabulary: Optional[List[str]] = None
+    ) -> tf.keras.layers.StringLookup:
+        """
+        StringLookup adapt từ values
+        Có base_vocabulary thì giữ nguyên thứ tự cũ và chỉ append tokens mới,
+        để index (và embedding row) của tokens cũ không đổi
+        """
+        lookup = tf.keras.layers.StringLookup(mask_token=None)
+        lookup.adapt(values)
+
+        if base_vocabulary is None:
+            return lookup
+
+        known = set(base_vocabulary)
+        new_tokens = [
+            token for token in lookup.get_vocabulary(include_special_tokens=False)
+            if token not in known
+        ]
+        return tf.keras.layers.StringLookup(vocabulary=list(base_vocabulary) + new_tokens, mask_token=None)
+
+    def vocabularies(self) -> Dict[str, List[str]]:
+        """Vocabularies hiện tại (không gồm OOV token), theo feature name"""
+        if self.user_ids_vocabulary is None:
+            return super().vocabularies()
+
+        return {
+            'user_id': self.user_ids_vocabulary.get_vocabulary(include_special_tokens=False),
+            'product_id': self.product_ids_vocabulary.get_vocabulary(include_special_tokens=False),
+            'category_id': self.category_vocabulary.get_vocabulary(include_special_tokens=False),
+            'brand_id': self.brand_vocabulary.get_vocabulary(include_special_tokens=False)
+        }
+
+    def build_user_model(
+        self,
+        user_ids: Union[List[str], tf.data.Dataset],
+        base_vocabulary: Optional[List[str]] = None
+    ) -> tf.keras.Model:
         """
         Build user tower
         Input: user_id
         Output: user embedding
+        user_ids có thể là list hoặc tf.data.Dataset (adapt streaming)
+        base_vocabulary: vocabulary của model cũ khi warm-start
         """
         # Create vocabulary
-        self.user_ids_vocabulary = tf.keras.layers.StringLookup(mask_token=None)
-        self.user_ids_vocabulary.adapt(user_ids)
+        self.user_ids_vocabulary = self._make_vocabulary(user_ids, base_vocabulary)
 
         user_model = tf.keras.Sequential([
+            # Input dtype phải khai báo rõ, nếu không Sequential sẽ cast input về float
+            tf.keras.Input(shape=(), dtype=tf.string, name='user_id'),
             self.user_ids_vocabulary,
             tf.keras.layers.Embedding(
                 input_dim=self.user_ids_vocabulary.vocabulary_size(),
@@ -79,25 +186,26 @@ class ProductRecommender:
         self,
         product_ids: List[str],
         categories: List[str],
-        brands: List[str]
+        brands: List[str],
+        base_vocabularies: Optional[Dict[str, List[str]]] = None
     ) -> tf.keras.Model:
         """
         Build item tower with multiple features:
         - product_id
         - category_id
         - brand_id
+        base_vocabularies: vocabularies của model cũ khi warm-start
         """
+        base_vocabularies = base_vocabularies or {}
+
         # Product ID vocabulary
-        self.product_ids_vocabulary = tf.keras.layers.StringLookup(mask_token=None)
-        self.product_ids_vocabulary.adapt(product_ids)
+        self.product_ids_vocabulary = self._make_vocabulary(product_ids, base_vocabularies.get('product_id'))
 
         # Category vocabulary
-        self.category_vocabulary = tf.keras.layers.StringLookup(mask_token=None)
-        self.category_vocabulary.adapt(categories)
+        self.category_vocabulary = self._make_vocabulary(categories, base_vocabularies.get('category_id'))
 
         # Brand vocabulary
-        self.brand_vocabulary = tf.keras.layers.StringLookup(mask_token=None)
-        self.brand_vocabulary.adapt(brands)
+        self.brand_vocabulary = self._make_vocabulary(brands, base_vocabularies.get('brand_id'))
 
         # Build model
         product_id_input = tf.keras.Input(shape=(), dtype=tf.string, name='product_id')
@@ -140,39 +248,99 @@ class ProductRecommender:
 
         return item_model
 
+    def _interactions_dataset(
+        self,
+        interactions: Optional[Union[List[Dict], Callable[[], Iterable[Dict]]]],
+        interaction_shards: Optional[List[str]]
+    ) -> tf.data.Dataset:
+        """
+        Dataset (user_id, product_id) từ:
+        - interaction_shards: các file TSV "user_id<TAB>product_id" trên disk
+        - interactions: list hoặc hàm trả về generator của {'user_id', 'product_id'}
+        Không materialize toàn bộ interactions thành tensors trong memory
+        """
+        if interaction_shards:
+            def parse_line(line):
+                fields = tf.strings.split(line, '\t')
+                return fields[0], fields[1]
+
+            return tf.data.Dataset.from_tensor_slices(interaction_shards).interleave(
+                tf.data.TextLineDataset,
+                cycle_length=min(len(interaction_shards), 4),
+                num_parallel_calls=tf.data.AUTOTUNE
+            ).map(parse_line, num_parallel_calls=tf.data.AUTOTUNE)
+
+        source = interactions if callable(interactions) else (lambda: interactions)
+
+        return tf.data.Dataset.from_generator(
+            lambda: ((i['user_id'], i['product_id']) for i in source()),
+            output_signature=(
+                tf.TensorSpec(shape=(), dtype=tf.string),
+                tf.TensorSpec(shape=(), dtype=tf.string)
+            )
+        )
+
     def prepare_and_train(
         self,
-        interactions: List[Dict],
-        products: List[Dict],
+        interactions: Optional[Union[List[Dict], Callable[[], Iterable[Dict]]]] = None,
+        products: List[Dict] = None,
         epochs: int = 5,
-        batch_size: int = 4096
+        batch_size: int = 4096,
+        interaction_shards: Optional[List[str]] = None,
+        shuffle_buffer_size: int = 100_000,
+        callbacks: Optional[List[tf.keras.callbacks.Callback]] = None,
+        warm_start: Optional[EmbeddingRecommender] = None
     ):
         """
         Train recommendation model
 
         interactions: [{'user_id': 'u1', 'product_id': 'p1'}, ...]
+            hoặc hàm trả về generator (được gọi lại mỗi epoch)
+        interaction_shards: thay cho interactions, các file TSV "user_id<TAB>product_id"
         products: [{'id': 'p1', 'category_id': 'c1', 'brand_id': 'b1'}, ...]
+        callbacks: Keras callbacks truyền vào fit() (vd: báo progress)
+        warm_start: model đã train trước đó (có thể là EmbeddingRecommender load
+            từ artifact, towers được load từ towers_path). Vocabularies được mở rộng thêm IDs mới,
+            embedding rows cũ và dense weights được copy sang rồi fine-tune tiếp
+            (interactions khi đó chỉ cần là interactions mới)
+
+        Input pipeline là streaming tf.data: memory phụ thuộc shuffle_buffer_size
+        và batch_size, không phụ thuộc số interactions
         """
         logger.info("Preparing training data...")
 
-        # Extract unique values
-        user_ids = list(set([i['user_id'] for i in interactions]))
-        product_ids = [p['id'] for p in products]
-        categories = [p.get('category_id', '') for p in products]
-        brands = [p.get('brand_id', '') for p in products]
+        interactions_ds = self._interactions_dataset(interactions, interaction_shards)
 
-        # Build models
-        logger.info("Building user and item models...")
-        user_model = self.build_user_model(user_ids)
-        item_model = self.build_item_model(product_ids, categories, brands)
+        # Warm-start: giữ toàn bộ catalog cũ làm candidates, features mới ghi đè
+        if warm_start:
+            products = warm_start.candidate_products() + list(products)
+        base_vocabularies = warm_start.vocabularies() if warm_start else {}
 
-        # Prepare candidates dataset (all products)
+        # Extract unique values (products đã unique theo id)
         products_dict = {p['id']: p for p in products}
+        product_ids = list(products_dict)
+        categories = [products_dict[pid].get('category_id', '') for pid in product_ids]
+        brands = [products_dict[pid].get('brand_id', '') for pid in product_ids]
+
+        # Build models (user vocabulary adapt streaming trên dataset)
+        logger.info("Building user and item models...")
+        user_model = self.build_user_model(
+            interactions_ds.map(lambda user_id, _: user_id).batch(batch_size),
+            base_vocabularies.get('user_id')
+        )
+        item_model = self.build_item_model(product_ids, categories, brands, base_vocabularies)
 
+        if warm_start:
+            logger.info("Warm-starting from previous model weights...")
+            previous = self._towers_of(warm_start)
+            self._copy_weights(previous.user_model, user_model)
+            self._copy_weights(previous.item_model, item_model)
+
+        # Prepare candidates dataset (all products)
         candidates_ds = tf.data.Dataset.from_tensor_slices({
             'product_id': product_ids,
-            'category_id': [products_dict[pid].get('category_id', '') for pid in product_ids],
-            'brand_id': [products_dict[pid].get('brand_id', '') for pid in product_ids]
+            'category_id': categories,
+            'brand_id': brands
         })
 
         # Create retrieval task
@@ -187,119 +355,207 @@ class ProductRecommender:
         self.model.compile(optimizer=tf.keras.optimizers.Adagrad(learning_rate=0.1))
 
         # Prepare training dataset
-        logger.info(f"Preparing {len(interactions)} interactions for training...")
-
-        train_data = []
-        for interaction in interactions:
-            product = products_dict.get(interaction['product_id'])
-            if product:
-                train_data.append({
-                    'user_id': interaction['user_id'],
-                    'product_id': interaction['product_id'],
-                    'category_id': product.get('category_id', ''),
-                    'brand_id': product.get('brand_id', '')
-                })
-
-        train_ds = tf.data.Dataset.from_tensor_slices({
-            'user_id': [d['user_id'] for d in train_data],
-            'product_id': [d['product_id'] for d in train_data],
-            'category_id': [d['category_id'] for d in train_data],
-            'brand_id': [d['brand_id'] for d in train_data]
-        })
+        logger.info("Preparing training input pipeline...")
 
-        train_ds = train_ds.shuffle(10000).batch(batch_size).cache()
+        # Product features join bằng hash tables, lookup vectorized trên cả batch
+        def lookup_table(values, default_value):
+            return tf.lookup.StaticHashTable(
+                tf.lookup.KeyValueTensorInitializer(product_ids, values),
+                default_value=default_value
+            )
+
+        known_products = lookup_table(tf.ones(len(product_ids), dtype=tf.int32), 0)
+        category_table = lookup_table(categories, '')
+        brand_table = lookup_table(brands, '')
+
+        def join_features(user_ids, batch_product_ids):
+            return {
+                'user_id': user_ids,
+                'product_id': batch_product_ids,
+                'category_id': category_table.lookup(batch_product_ids),
+                'brand_id': brand_table.lookup(batch_product_ids)
+            }
+
+        train_ds = (
+            interactions_ds
+            # Bỏ interactions của products không có features
+            .filter(lambda _, product_id: known_products.lookup(product_id) > 0)
+            .shuffle(shuffle_buffer_size)
+            .batch(batch_size)
+            .map(join_features, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
 
         # Train
         logger.info(f"Training model for {epochs} epochs...")
-        self.model.fit(train_ds, epochs=epochs, verbose=1)
+        self.model.fit(train_ds, epochs=epochs, verbose=1, callbacks=callbacks)
+
+        # Precompute candidate embeddings một lần, dùng cho index và để save
+        logger.info("Computing candidate embeddings...")
+        self.user_embeddings = user_model.layers[-1].get_weights()[0]
+        self.candidate_ids, self.candidate_embeddings = self._compute_candidate_embeddings(candidates_ds)
+        self.candidate_categories = np.array(categories)
+        self.candidate_brands = np.array(brands)
 
         # Build BruteForce index for fast retrieval
         logger.info("Building retrieval index...")
-        self.item_index = tfrs.layers.factorized_top_k.BruteForce(self.model.user_model)
-        self.item_index.index_from_dataset(
-            candidates_ds.batch(100).map(lambda x: (x['product_id'], self.model.item_model(x)))
-        )
+        self._build_index()
+
+        # Similar products: precompute neighbors một lần, serving chỉ là lookup
+        if self.num_item_neighbors > 0:
+            logger.info(f"Computing top {self.num_item_neighbors} neighbors per product...")
+            self.item_neighbors, self.item_neighbor_scores = compute_item_neighbors(
+                self.candidate_embeddings,
+                self.num_item_neighbors
+            )
 
         self.is_trained = True
         logger.info("Training completed!")
 
-    def recommend(
-        self,
-        user_id: str,
-        k: int = 10,
-        filter_products: Optional[List[str]] = None
-    ) -> List[Tuple[str, float]]:
+    @staticmethod
+    def _copy_weights(source: tf.keras.Model, target: tf.keras.Model):
         """
-        Get recommendations for user
-        Returns: [(product_id, score), ...]
+        Copy weights từ tower cũ sang tower mới (cùng kiến trúc)
+        Embedding tables mới lớn hơn (vocabulary mở rộng): copy các rows cũ,
+        rows của IDs mới giữ random init
         """
-        if not self.is_trained or self.item_index is None:
-            logger.warning("Model not trained yet")
-            return []
-
-        try:
-            # Get recommendations
-            scores, product_ids = self.item_index(tf.constant([user_id]), k=k)
-
-            # Convert to list
-            recommendations = []
-            for product_id, score in zip(product_ids[0].numpy(), scores[0].numpy()):
-                product_id_str = product_id.decode('utf-8')
-
-                # Filter if needed
-                if filter_products and product_id_str in filter_products:
-                    continue
-
-                recommendations.append((product_id_str, float(score)))
+        def layers_of(model, layer_type):
+            return [layer for layer in model.layers if isinstance(layer, layer_type)]
+
+        for old_layer, new_layer in zip(
+            layers_of(source, tf.keras.layers.Embedding),
+            layers_of(target, tf.keras.layers.Embedding)
+        ):
+            old_weights = old_layer.get_weights()[0]
+            new_weights = new_layer.get_weights()[0]
+            new_weights[:len(old_weights)] = old_weights
+            new_layer.set_weights([new_weights])
+
+        for old_layer, new_layer in zip(
+            layers_of(source, tf.keras.layers.Dense),
+            layers_of(target, tf.keras.layers.Dense)
+        ):
+            new_layer.set_weights(old_layer.get_weights())
+
+    def _compute_candidate_embeddings(
+        self,
+        candidates_ds: tf.data.Dataset
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Chạy item tower trên toàn bộ candidates, trả về (product_ids, embeddings)"""
+        ids = []
+        embeddings = []
 
-            return recommendations
+        for batch in candidates_ds.batch(1024):
+            ids.append(batch['product_id'].numpy())
+            embeddings.append(self.model.item_model(batch).numpy())
 
-        except Exception as e:
-            logger.error(f"Error getting recommendations: {e}", exc_info=True)
-            return []
+        product_ids = np.array([pid.decode('utf-8') for pid in np.concatenate(ids)])
+        return product_ids, np.concatenate(embeddings).astype(np.float32)
 
-    def save(self, path: str):
-        """Save model"""
-        logger.info(f"Saving model to {path}")
+    def _build_index_backend(self, ivf_centroids: Optional[np.ndarray], ivf_assignments: Optional[np.ndarray]):
+        if self.retrieval_backend != "bruteforce":
+            super()._build_index_backend(ivf_centroids, ivf_assignments)
+            return
 
-        # Save TF model
-        self.model.save(f"{path}_model")
-
-        # Save vocabularies and metadata
-        metadata = {
-            'embedding_dim': self.embedding_dim,
-            'is_trained': self.is_trained,
-            'user_ids_vocabulary': self.user_ids_vocabulary,
-            'product_ids_vocabulary': self.product_ids_vocabulary,
-            'category_vocabulary': self.category_vocabulary,
-            'brand_vocabulary': self.brand_vocabulary
-        }
-
-        with open(f"{path}_metadata.pkl", 'wb') as f:
-            pickle.dump(metadata, f)
+        self.item_index = tfrs.layers.factorized_top_k.BruteForce(self.model.user_model)
+        self.item_index.index(
+            candidates=tf.constant(self.candidate_embeddings),
+            identifiers=tf.constant(self.candidate_ids)
+        )
 
-        logger.info("Model saved successfully")
+    def _query_index(
+        self,
+        user_ids: List[str],
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Query index với backend đang dùng
+        exclude: candidate rows bị loại theo từng user (mask trước top-k)
+        Returns: (scores, product_ids) dạng NumPy, shape (B x k)
+        """
+        if self.retrieval_backend != "bruteforce":
+            return super()._query_index(user_ids, k, exclude)
 
-    def load(self, path: str):
-        """Load model"""
-        logger.info(f"Loading model from {path}")
+        if exclude is not None and any(rows is not None for rows in exclude):
+            # BruteForce của TFRS không mask được theo từng user: lấy user vectors rồi score bằng NumPy
+            queries = self.user_embeddings[[self.user_lookup.get(user_id, 0) for user_id in user_ids]]
+            return self._query_vectors(queries, k, exclude)
 
-        # Load TF model
-        self.model = tf.keras.models.load_model(f"{path}_model")
+        scores, product_ids = self.item_index(tf.constant(user_ids), k=min(k, len(self.candidate_ids)))
+        decoded = np.vectorize(lambda pid: pid.decode('utf-8'), otypes=[object])(product_ids.numpy())
+        return scores.numpy(), decoded
 
-        # Load metadata
-        with open(f"{path}_metadata.pkl", 'rb') as f:
-            metadata = pickle.load(f)
+    def _query_vectors(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Exclusions = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Query index bằng user vectors có sẵn (B x d) thay vì user ids"""
+        if self.retrieval_backend != "bruteforce":
+            return super()._query_vectors(queries, k, exclude)
+
+        scores = queries @ np.asarray(self.candidate_embeddings).T
+        mask_scores(scores, exclude)
+        scores, rows = top_k(scores, k)
+        return scores, self.candidate_ids[rows]
+
+    def save(self, path: str, keep_versions: int = 3) -> str:
+        """
+        Save model thành artifact version mới trong directory path (xem ArtifactWriter)
+        Không pickle: vocabularies là text files, embeddings/index là .npy, metadata là JSON
+        keep_versions: số versions giữ lại trên disk
+        Returns: version của artifact
+        """
+        logger.info(f"Saving model to {path}")
+        num_candidates = len(self.candidate_ids)
 
-        self.embedding_dim = metadata['embedding_dim']
-        self.is_trained = metadata['is_trained']
-        self.user_ids_vocabulary = metadata['user_ids_vocabulary']
-        self.product_ids_vocabulary = metadata['product_ids_vocabulary']
-        self.category_vocabulary = metadata['category_vocabulary']
-        self.brand_vocabulary = metadata['brand_vocabulary']
+        writer = ArtifactWriter(path)
+        try:
+            for name, vocabulary in self.vocabularies().items():
+                writer.add_strings(f"vocab_{name}", vocabulary)
 
-        # Rebuild index
-        # Note: Cần rebuild candidates dataset để tạo lại index
-        logger.warning("Index needs to be rebuilt after loading")
+            writer.add_strings("candidate_ids", self.candidate_ids)
+            writer.add_strings(
+                "candidate_categories",
+                self.candidate_categories if self.candidate_categories is not None else [''] * num_candidates
+            )
+            writer.add_strings(
+                "candidate_brands",
+                self.candidate_brands if self.candidate_brands is not None else [''] * num_candidates
+            )
 
-        logger.info("Model loaded successfully")
\ No newline at end of file
+            writer.add_array("user_embeddings", np.asarray(self.user_embeddings, dtype=np.float32))
+            writer.add_array("candidate_embeddings", np.asarray(self.candidate_embeddings, dtype=np.float32))
+
+            # IVF: lưu centroids + assignments để load() không phải chạy lại k-means
+            if self.retrieval_backend == "ivf":
+                writer.add_array("ivf_centroids", self.item_index.centroids)
+                writer.add_array("ivf_assignments", self.item_index.assignments)
+
+            if self.item_neighbors is not None:
+                writer.add_array("item_neighbors", self.item_neighbors)
+                writer.add_array("item_neighbor_scores", self.item_neighbor_scores)
+
+            # Keras towers chỉ cần cho warm-start training và bruteforce backend
+            # (subclassed TwoTowerRecommenderModel không có input shape nên lưu từng tower)
+            self.model.user_model.save(writer.path("towers", "user_model"))
+            self.model.item_model.save(writer.path("towers", "item_model"))
+
+            version = writer.commit({
+                'embedding_dim': self.embedding_dim,
+                'is_trained': self.is_trained,
+                'trained_at': self.trained_at,
+                'retrieval_backend': self.retrieval_backend,
+                'num_candidates': num_candidates,
+                'num_users': len(self.user_embeddings)
+            })
+        except Exception:
+            writer.abort()
+            raise
+
+        prune_versions(path, keep_versions)
+
+        logger.info(f"Model saved successfully (version {version})")
+        return version
@@ -0,0 +1,83 @@
+import json
+from typing import List, Optional, Dict
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.services.redis_service import (
+    decode_recommendations,
+    recommendations_cache_key,
+    trending_key
+)
+
+_pool: Optional[aioredis.ConnectionPool] = None
+
+
+def get_async_connection_pool() -> aioredis.ConnectionPool:
+    """
+    Connection pool asyncio dùng chung toàn process
+    Chỉ dùng trong event loop của FastAPI (connections gắn với loop tạo ra chúng)
+    """
+    global _pool
+
+    if _pool is None:
+        _pool = aioredis.BlockingConnectionPool(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            decode_responses=True,
+            max_connections=settings.redis_max_connections,
+            timeout=5
+        )
+    return _pool
+
+
+async def close_async_connection_pool():
+    """Đóng pool khi app shutdown"""
+    global _pool
+
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
+
+
+class AsyncRedisService:
+    """
+    Asyncio version của RedisService cho các async FastAPI handlers
+    Không block event loop khi chờ Redis
+    """
+
+    def __init__(self):
+        self.client = aioredis.Redis(connection_pool=get_async_connection_pool())
+
+    async def get_user_history(self, user_id: str, limit: int = 10) -> List[str]:
+        """Lấy history của user (recent first)"""
+        key = f"user:history:{user_id}"
+
+        product_ids = await self.client.zrevrange(key, 0, limit - 1)
+        return list(product_ids)
+
+    async def get_popular_products(self, limit: int = 10, category_id: Optional[str] = None) -> List[str]:
+        """Lấy top popular products (trending đã materialize)"""
+        return list(await self.client.zrevrange(trending_key(category_id), 0, limit - 1))
+
+    async def save_recommendations_cache(
+        self,
+        user_id: str,
+        recommendations: List[Dict],
+        model_version: Optional[str],
+        ttl: int = 3600
+    ):
+        """Cache recommendations cho user theo model version"""
+        key = recommendations_cache_key(user_id, model_version)
+        payload = {"model_version": model_version, "items": recommendations}
+        await self.client.setex(key, ttl, json.dumps(payload))
+
+    async def get_recommendations_cache(self, user_id: str, model_version: Optional[str]) -> Optional[List[Dict]]:
+        """Lấy cached recommendations của model version hiện tại"""
+        key = recommendations_cache_key(user_id, model_version)
+        data = await self.client.get(key)
+
+        if data:
+            return decode_recommendations(data)
+        return None
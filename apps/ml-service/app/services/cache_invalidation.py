@@ -0,0 +1,69 @@
+import json
+import logging
+import threading
+from typing import Optional
+
+from app.services.local_cache import LocalCache, recommendation_cache
+from app.services.redis_service import RECOMMENDATIONS_INVALIDATION_CHANNEL, RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class CacheInvalidationListener:
+    """
+    Background thread subscribe RECOMMENDATIONS_INVALIDATION_CHANNEL
+
+    - View event chỉ được xử lý ở một process (Kafka consumer group), process đó
+      publish user ids khi invalidate (RedisService.invalidate_recommendations_cache)
+    - Mọi process (kể cả process publish) xoá (model_version, user_id) khỏi in-process cache
+    - Khi mất kết nối Redis, messages trong lúc đó bị mất: staleness khi đó
+      vẫn bị giới hạn bởi local_cache_ttl_s
+    - Giữ một connection riêng từ pool trong suốt thời gian chạy
+    """
+
+    def __init__(self, cache: LocalCache, reconnect_delay_s: float = 1.0):
+        self.cache = cache
+        self.reconnect_delay_s = reconnect_delay_s
+        self.redis = RedisService()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation-listener", daemon=True)
+        self._thread.start()
+        logger.info(f"Listening for cache invalidations on {RECOMMENDATIONS_INVALIDATION_CHANNEL}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def handle_message(self, data: str) -> int:
+        """Xoá các users trong message khỏi cache, returns số entries đã xoá"""
+        payload = json.loads(data)
+        version = payload.get("model_version")
+        return self.cache.invalidate_many((version, user_id) for user_id in payload.get("user_ids", []))
+
+    def _run(self):
+        while not self._stop.is_set():
+            pubsub = self.redis.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(RECOMMENDATIONS_INVALIDATION_CHANNEL)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self.handle_message(message["data"])
+            except Exception as e:
+                logger.error(f"Error listening for cache invalidations: {e}", exc_info=True)
+                self._stop.wait(self.reconnect_delay_s)
+            finally:
+                pubsub.close()
+
+
+cache_invalidation_listener = CacheInvalidationListener(recommendation_cache)
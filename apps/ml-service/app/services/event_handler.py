@@ -1,6 +1,9 @@
 import logging
-from typing import Dict, Any
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 from app.services.recommendation_service import RecommendationService
+from app.services.redis_service import RedisService
 from app.services.kafka_producer import KafkaProducerService
 
 logger = logging.getLogger(__name__)
@@ -12,14 +15,42 @@ class ProductViewEventHandler:
 
     Flow:
     1. Nhận event product.viewed từ Kafka
-    2. Lấy recommendations từ ML model
-    3. Gửi danh sách product IDs qua Kafka
-    4. Product Service sẽ consume và query chi tiết
+    2. Ghi view vào user history + popularity (Redis)
+    3. Lấy recommendations từ ML model
+    4. Gửi danh sách product IDs qua Kafka
+    5. Product Service sẽ consume và query chi tiết
     """
 
     def __init__(self):
         self.recommendation_service = RecommendationService()
         self.kafka_producer = KafkaProducerService()
+        self.redis = RedisService()
+
+    @staticmethod
+    def _parse_timestamp(value: Any) -> int:
+        """Timestamp của event (ISO string hoặc epoch s/ms) -> epoch seconds"""
+        if isinstance(value, (int, float)):
+            # Epoch milliseconds
+            return int(value / 1000) if value > 1e12 else int(value)
+
+        if isinstance(value, str) and value:
+            try:
+                return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+            except ValueError:
+                pass
+
+        return int(time.time())
+
+    def _extract_view(self, message: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+        """(user_id, product_id, timestamp) từ message, None nếu message không hợp lệ"""
+        user_id = message.get('userId')
+        product_id = message.get('productId')
+
+        if not user_id or not product_id:
+            logger.warning(f"Missing userId or productId in message: {message}")
+            return None
+
+        return user_id, product_id, self._parse_timestamp(message.get('timestamp'))
 
     async def handle_product_viewed(self, message: Dict[str, Any]):
         """
@@ -34,23 +65,29 @@ class ProductViewEventHandler:
         }
         """
         try:
-            user_id = message.get('userId')
-            product_id = message.get('productId')
-
-            if not user_id or not product_id:
-                logger.warning(f"Missing userId or productId in message: {message}")
+            view = self._extract_view(message)
+            if not view:
                 return
 
+            user_id, product_id, _ = view
+
             logger.info(
                 f"Processing product.viewed event - User: {user_id}, Product: {product_id}"
             )
 
-            # Lấy recommendations từ ML model
+            # Ghi history + popularity
+            self.redis.record_views([view])
+
+            # History đổi nên cached recommendations của user không còn đúng
+            self.recommendation_service.invalidate_cached_recommendations([user_id])
+
+            # Lấy recommendations từ ML model (cache vừa bị invalidate nên tính lại luôn)
             # Ưu tiên personalized recommendations cho user
             recommendations = self.recommendation_service.get_recommendations_for_user(
                 user_id=user_id,
                 current_product_id=product_id,
-                limit=10
+                limit=10,
+                use_cache=False
             )
 
             # Extract chỉ product IDs
@@ -80,6 +117,65 @@ class ProductViewEventHandler:
                 exc_info=True
             )
 
+    async def handle_product_viewed_batch(self, messages: List[Dict[str, Any]]):
+        """
+        Xử lý một batch product.viewed events (từ consumer.poll())
+
+        - Ghi tất cả views vào history/popularity trong một Redis pipeline
+        - Gộp nhiều views của cùng một user, chỉ giữ view mới nhất
+        - Tính recommendations cho tất cả users bằng một lần gọi model
+        - Gửi kết quả qua Kafka cùng lúc
+        """
+        try:
+            views = [view for view in map(self._extract_view, messages) if view]
+            if not views:
+                return
+
+            # Ghi history + popularity của toàn bộ batch trong một Redis pipeline
+            self.redis.record_views(views)
+            self.recommendation_service.invalidate_cached_recommendations(
+                list({user_id for user_id, _, _ in views})
+            )
+
+            # Messages theo thứ tự offset, view sau ghi đè view trước
+            latest_views: Dict[str, str] = {}
+            for user_id, product_id, _ in views:
+                latest_views.pop(user_id, None)
+                latest_views[user_id] = product_id
+
+            logger.info(
+                f"Processing {len(messages)} product.viewed events for {len(latest_views)} users"
+            )
+
+            # Cache của các users này vừa bị invalidate ở trên, đọc lại chắc chắn miss
+            recommendations = self.recommendation_service.get_recommendations_for_users(
+                user_ids=list(latest_views),
+                limit=10,
+                use_cache=False
+            )
+
+            batch = []
+            for user_id, product_id in latest_views.items():
+                product_ids = [rec.product_id for rec in recommendations.get(user_id, [])]
+                if not product_ids:
+                    logger.info(f"No recommendations found for user {user_id}")
+                    continue
+
+                batch.append({
+                    'user_id': user_id,
+                    'product_ids': product_ids,
+                    'request_id': f"view_{product_id}_{user_id}"
+                })
+
+            if batch:
+                self.kafka_producer.send_recommendations_batch(batch)
+
+        except Exception as e:
+            logger.error(
+                f"Error handling product.viewed batch: {e}",
+                exc_info=True
+            )
+
     def close(self):
         """Cleanup resources"""
         if self.recommendation_service:
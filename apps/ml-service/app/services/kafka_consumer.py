@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
-from typing import Callable, Dict, Any
+from collections import defaultdict
+from typing import Callable, Dict, Any, List
 from kafka import KafkaConsumer
 from kafka.errors import KafkaError
 from app.config import settings
@@ -17,6 +19,7 @@ class KafkaConsumerService:
     def __init__(self):
         self.consumer = None
         self.handlers: Dict[str, Callable] = {}
+        self.batch_handlers: Dict[str, Callable] = {}
         self.running = False
 
     def connect(self):
@@ -30,7 +33,7 @@ class KafkaConsumerService:
                 key_deserializer=lambda k: k.decode('utf-8') if k else None,
                 auto_offset_reset='latest',  # Chỉ xử lý message mới
                 enable_auto_commit=True,
-                max_poll_records=10
+                max_poll_records=settings.kafka_max_poll_records
             )
             logger.info(
                 f"Kafka consumer connected - Topic: {settings.kafka_topic_product_view}, "
@@ -51,6 +54,17 @@ class KafkaConsumerService:
         self.handlers[topic] = handler
         logger.info(f"Registered handler for topic: {topic}")
 
+    def register_batch_handler(self, topic: str, handler: Callable):
+        """
+        Đăng ký batch handler cho một topic (dùng khi kafka_batch_mode bật)
+
+        Args:
+            topic: Kafka topic name
+            handler: Async function nhận list messages của một lần poll
+        """
+        self.batch_handlers[topic] = handler
+        logger.info(f"Registered batch handler for topic: {topic}")
+
     async def handle_message(self, topic: str, message: Dict[str, Any]):
         """Xử lý message từ Kafka"""
         handler = self.handlers.get(topic)
@@ -62,38 +76,41 @@ class KafkaConsumerService:
         else:
             logger.warning(f"No handler registered for topic: {topic}")
 
+    async def handle_batch(self, topic: str, messages: List[Dict[str, Any]]):
+        """Xử lý batch messages của một topic, fallback về handler từng message"""
+        handler = self.batch_handlers.get(topic)
+        if handler:
+            try:
+                await handler(messages)
+            except Exception as e:
+                logger.error(f"Error in batch handler for topic {topic}: {e}", exc_info=True)
+            return
+
+        for message in messages:
+            await self.handle_message(topic, message)
+
+    @staticmethod
+    def _get_event_loop() -> asyncio.AbstractEventLoop:
+        # Consumer chạy trong thread riêng nên cần event loop riêng
+        try:
+            return asyncio.get_event_loop()
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            return loop
+
     def start(self):
         """Bắt đầu consume messages"""
         if not self.consumer:
             self.connect()
 
         self.running = True
-        logger.info("Starting Kafka consumer loop...")
 
         try:
-            for message in self.consumer:
-                if not self.running:
-                    break
-
-                topic = message.topic
-                value = message.value
-                key = message.key
-
-                logger.info(
-                    f"Received message - Topic: {topic}, Key: {key}, "
-                    f"Partition: {message.partition}, Offset: {message.offset}"
-                )
-
-                # Xử lý message đồng bộ (vì kafka consumer không async)
-                # Handler sẽ được gọi trong event loop riêng
-                import asyncio
-                try:
-                    loop = asyncio.get_event_loop()
-                except RuntimeError:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-
-                loop.run_until_complete(self.handle_message(topic, value))
+            if settings.kafka_batch_mode:
+                self._consume_batches()
+            else:
+                self._consume_messages()
 
         except KafkaError as e:
             logger.error(f"Kafka error: {e}")
@@ -102,6 +119,55 @@ class KafkaConsumerService:
         finally:
             self.stop()
 
+    def _consume_messages(self):
+        """Consume từng message một"""
+        logger.info("Starting Kafka consumer loop...")
+        loop = self._get_event_loop()
+
+        for message in self.consumer:
+            if not self.running:
+                break
+
+            topic = message.topic
+            value = message.value
+            key = message.key
+
+            logger.info(
+                f"Received message - Topic: {topic}, Key: {key}, "
+                f"Partition: {message.partition}, Offset: {message.offset}"
+            )
+
+            # Xử lý message đồng bộ (vì kafka consumer không async)
+            # Handler sẽ được gọi trong event loop riêng
+            loop.run_until_complete(self.handle_message(topic, value))
+
+    def _consume_batches(self):
+        """
+        Consume theo batch bằng poll(): mỗi lần lấy tối đa kafka_max_poll_records
+        messages và giao cả batch cho handler của topic
+        """
+        logger.info(
+            f"Starting Kafka consumer batch loop (max {settings.kafka_max_poll_records} records/poll)..."
+        )
+        loop = self._get_event_loop()
+
+        while self.running:
+            records = self.consumer.poll(
+                timeout_ms=settings.kafka_poll_timeout_ms,
+                max_records=settings.kafka_max_poll_records
+            )
+            if not records:
+                continue
+
+            # Gom messages theo topic, giữ thứ tự offset trong từng partition
+            by_topic: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for topic_partition, messages in records.items():
+                by_topic[topic_partition.topic].extend(m.value for m in messages)
+
+            for topic, values in by_topic.items():
+                logger.info(f"Received batch - Topic: {topic}, Messages: {len(values)}")
+                loop.run_until_complete(self.handle_batch(topic, values))
+
     def stop(self):
         """Dừng consumer"""
         self.running = False
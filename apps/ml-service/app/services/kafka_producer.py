@@ -1,6 +1,7 @@
 import json
 import logging
-from typing import List
+import threading
+from typing import Dict, List, Optional
 from kafka import KafkaProducer
 from kafka.errors import KafkaError
 from app.config import settings
@@ -12,10 +13,30 @@ class KafkaProducerService:
     """
     Kafka Producer để gửi recommendations (productIds)
     từ ML service sang Product service
+
+    Hai chế độ gửi:
+    - async (mặc định, kafka_producer_async=True): enqueue rồi return ngay,
+      kết quả được xử lý trong delivery callbacks
+    - sync: chờ broker xác nhận từng message (future.get)
+
+    Số message chưa được xác nhận bị giới hạn bởi kafka_producer_max_queued,
+    vượt quá thì send sẽ chờ tối đa kafka_producer_enqueue_timeout_ms (backpressure)
+
+    Cả hai chế độ đều có thể block (slot, producer.send chờ metadata/buffer tới
+    kafka_producer_max_block_ms), async code phải gọi qua run_in_threadpool
     """
 
     def __init__(self):
         self.producer = None
+
+        # Bounded queue: mỗi message đang chờ delivery giữ một slot
+        self._slots = threading.BoundedSemaphore(settings.kafka_producer_max_queued)
+        self._stats_lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queued = 0
+
         self._connect()
 
     def _connect(self):
@@ -25,9 +46,13 @@ class KafkaProducerService:
                 bootstrap_servers=settings.kafka_bootstrap_servers,
                 value_serializer=lambda v: json.dumps(v).encode('utf-8'),
                 key_serializer=lambda k: k.encode('utf-8') if k else None,
-                acks='all',
+                acks=settings.kafka_producer_acks,
                 retries=3,
-                max_in_flight_requests_per_connection=1
+                max_in_flight_requests_per_connection=settings.kafka_producer_max_in_flight,
+                linger_ms=settings.kafka_producer_linger_ms,
+                batch_size=settings.kafka_producer_batch_size,
+                compression_type=settings.kafka_producer_compression_type,
+                max_block_ms=settings.kafka_producer_max_block_ms
             )
             logger.info(f"Connected to Kafka: {settings.kafka_bootstrap_servers}")
         except Exception as e:
@@ -38,7 +63,8 @@ class KafkaProducerService:
         self,
         user_id: str,
         product_ids: List[str],
-        request_id: str = None
+        request_id: str = None,
+        wait: Optional[bool] = None
     ) -> bool:
         """
         Gửi danh sách product IDs lên Kafka topic 'product.recommendations'
@@ -48,21 +74,24 @@ class KafkaProducerService:
             user_id: ID của user
             product_ids: Danh sách product IDs được recommend
             request_id: Optional request ID để tracking
+            wait: True = chờ broker xác nhận, False = chỉ enqueue,
+                None = theo settings.kafka_producer_async
 
         Returns:
-            bool: True nếu gửi thành công
+            bool: True nếu gửi thành công (async: nếu enqueue thành công)
         """
         if not self.producer:
             logger.error("Kafka producer not initialized")
             return False
 
+        if wait is None:
+            wait = not settings.kafka_producer_async
+
         try:
-            message = {
-                "user_id": user_id,
-                "product_ids": product_ids,
-                "request_id": request_id,
-                "timestamp": None  # Kafka sẽ tự động thêm timestamp
-            }
+            message = self._build_message(user_id, product_ids, request_id)
+
+            if not wait:
+                return self._enqueue(user_id, message)
 
             # Gửi message với key là user_id để đảm bảo ordering
             future = self.producer.send(
@@ -74,6 +103,9 @@ class KafkaProducerService:
             # Wait for send to complete (blocking)
             record_metadata = future.get(timeout=10)
 
+            with self._stats_lock:
+                self.delivered += 1
+
             logger.info(
                 f"Sent recommendations to Kafka - Topic: {record_metadata.topic}, "
                 f"Partition: {record_metadata.partition}, "
@@ -85,15 +117,145 @@ class KafkaProducerService:
             return True
 
         except KafkaError as e:
+            with self._stats_lock:
+                self.failed += 1
             logger.error(f"Kafka error sending recommendations: {e}")
             return False
         except Exception as e:
+            with self._stats_lock:
+                self.failed += 1
             logger.error(f"Error sending recommendations: {e}")
             return False
 
+    def send_recommendations_batch(self, batch: List[Dict], wait: Optional[bool] = None) -> int:
+        """
+        Gửi recommendations của nhiều users
+        Sync mode chỉ chờ broker một lần cho cả batch
+
+        Args:
+            batch: [{'user_id': ..., 'product_ids': [...], 'request_id': ...}, ...]
+            wait: xem send_recommendations
+
+        Returns:
+            int: Số message gửi thành công (async: số message enqueue thành công)
+        """
+        if not self.producer:
+            logger.error("Kafka producer not initialized")
+            return 0
+
+        if wait is None:
+            wait = not settings.kafka_producer_async
+
+        if not wait:
+            enqueued = sum(
+                self._enqueue(
+                    item['user_id'],
+                    self._build_message(item['user_id'], item['product_ids'], item.get('request_id'))
+                )
+                for item in batch
+            )
+            logger.info(f"Enqueued {enqueued}/{len(batch)} recommendation messages to Kafka")
+            return enqueued
+
+        futures = []
+        for item in batch:
+            try:
+                message = self._build_message(item['user_id'], item['product_ids'], item.get('request_id'))
+                futures.append((item['user_id'], self.producer.send(
+                    settings.kafka_topic_recommendations,
+                    key=item['user_id'],
+                    value=message
+                )))
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed += 1
+                logger.error(f"Error sending recommendations for user {item.get('user_id')}: {e}")
+
+        # Flush một lần rồi mới kiểm tra kết quả từng message
+        self.producer.flush(timeout=10)
+
+        sent = 0
+        for user_id, future in futures:
+            try:
+                future.get(timeout=10)
+                sent += 1
+            except KafkaError as e:
+                logger.error(f"Kafka error sending recommendations for user {user_id}: {e}")
+
+        with self._stats_lock:
+            self.delivered += sent
+            self.failed += len(futures) - sent
+
+        logger.info(f"Sent {sent}/{len(batch)} recommendation messages to Kafka")
+        return sent
+
+    def _enqueue(self, user_id: str, message: Dict) -> bool:
+        """Enqueue message không chờ broker, kết quả xử lý trong callbacks"""
+        timeout = settings.kafka_producer_enqueue_timeout_ms / 1000
+        if not self._slots.acquire(timeout=timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            logger.warning(f"Kafka producer queue full, dropping recommendations for user {user_id}")
+            return False
+
+        with self._stats_lock:
+            self.queued += 1
+
+        try:
+            future = self.producer.send(
+                settings.kafka_topic_recommendations,
+                key=user_id,
+                value=message
+            )
+        except Exception as e:
+            self._on_send_error(user_id, e)
+            return False
+
+        future.add_callback(self._on_send_success, user_id)
+        future.add_errback(self._on_send_error, user_id)
+        return True
+
+    def _on_send_success(self, user_id: str, record_metadata):
+        self._slots.release()
+        with self._stats_lock:
+            self.queued -= 1
+            self.delivered += 1
+
+        logger.debug(
+            f"Delivered recommendations - Partition: {record_metadata.partition}, "
+            f"Offset: {record_metadata.offset}, User: {user_id}"
+        )
+
+    def _on_send_error(self, user_id: str, error: Exception):
+        self._slots.release()
+        with self._stats_lock:
+            self.queued -= 1
+            self.failed += 1
+
+        logger.error(f"Failed to deliver recommendations for user {user_id}: {error}")
+
+    @staticmethod
+    def _build_message(user_id: str, product_ids: List[str], request_id: str = None) -> Dict:
+        return {
+            "user_id": user_id,
+            "product_ids": product_ids,
+            "request_id": request_id,
+            "timestamp": None  # Kafka sẽ tự động thêm timestamp
+        }
+
+    def stats(self) -> Dict:
+        """Counters cho monitoring"""
+        with self._stats_lock:
+            return {
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "queued": self.queued
+            }
+
     def close(self):
         """Đóng kết nối Kafka producer"""
         if self.producer:
             self.producer.flush()
             self.producer.close()
-            logger.info("Kafka producer closed")
\ No newline at end of file
+            logger.info("Kafka producer closed")
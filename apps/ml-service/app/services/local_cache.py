@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+
+
+class LocalCache:
+    """
+    In-process LRU cache có TTL, thread-safe
+
+    - Tối đa max_size entries, vượt quá thì bỏ entry ít dùng nhất (LRU)
+    - Entry hết hạn sau ttl_s giây (kiểm tra lúc get)
+    - Values được trả về nguyên object (không copy), caller không được sửa
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl_s: float = 30.0, name: str = "local-cache"):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.name = name
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_s: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl_s if ttl_s is None else ttl_s)
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            self.invalidations += 1
+            return True
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> int:
+        with self._lock:
+            removed = sum(1 for key in keys if self._entries.pop(key, None) is not None)
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Counters cho monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+
+# Cache dùng chung toàn process: (model_version, user_id) -> List[ProductRecommendation]
+# Invalidate khi có view event mới của user, ở mọi process (xem CacheInvalidationListener)
+recommendation_cache = LocalCache(
+    max_size=settings.local_cache_max_size,
+    ttl_s=settings.local_cache_ttl_s,
+    name="recommendation-cache"
+)
@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from typing import Optional, Tuple, Type
+
+from app.config import settings
+from app.models.artifact import current_version
+from app.models.embedding_recommender import EmbeddingRecommender
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry giữ model (EmbeddingRecommender/ProductRecommender) đang serve
+
+    - Tất cả services (HTTP routes, training, Kafka handler) dùng chung một model
+    - Model mới được train xong hoàn toàn (kể cả retrieval index) rồi mới swap vào
+    - Swap là một phép gán reference duy nhất nên serving không bao giờ bị pause
+      hay thấy model đang build dở
+    - Mỗi serving process (uvicorn worker, replica) poll artifact CURRENT pointer
+      (start_watching) và reload khi có version mới từ training job
+    - serving_mode "numpy": serve bằng EmbeddingRecommender, TensorFlow chỉ được
+      import trong training process (new_model(trainable=True))
+    """
+
+    SERVING_MODES = ("tensorflow", "numpy")
+
+    def __init__(
+        self,
+        model_path: str,
+        embedding_dim: int,
+        retrieval_backend: str,
+        serving_mode: str = "tensorflow"
+    ):
+        if serving_mode not in self.SERVING_MODES:
+            raise ValueError(f"Unknown serving mode: {serving_mode}")
+
+        if serving_mode == "numpy" and retrieval_backend == "bruteforce":
+            # Cùng ranking với BruteForce nhưng không cần TensorFlow
+            logger.info("Serving mode 'numpy' does not support bruteforce backend, using 'numpy' backend")
+            retrieval_backend = "numpy"
+
+        self.model_path = model_path
+        self.embedding_dim = embedding_dim
+        self.retrieval_backend = retrieval_backend
+        self.serving_mode = serving_mode
+
+        # (model, version) được đọc/ghi cùng nhau để luôn nhất quán
+        self._current: Optional[Tuple[EmbeddingRecommender, Optional[str]]] = None
+        self._lock = threading.Lock()
+
+        self._stop_watching = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _model_class(self, trainable: bool) -> Type[EmbeddingRecommender]:
+        if self.serving_mode == "numpy" and not trainable:
+            return EmbeddingRecommender
+
+        # Import TensorFlow lazily, serving process ở mode "numpy" không bao giờ tới đây
+        from app.models.tfrs_model import ProductRecommender
+        return ProductRecommender
+
+    def new_model(self, trainable: bool = False) -> EmbeddingRecommender:
+        """
+        Tạo model rỗng theo config của registry
+        trainable: luôn là ProductRecommender (cần TensorFlow), dùng để train
+        """
+        return self._model_class(trainable)(
+            embedding_dim=self.embedding_dim,
+            retrieval_backend=self.retrieval_backend,
+            ivf_num_lists=settings.ivf_num_lists,
+            ivf_num_probes=settings.ivf_num_probes,
+            fold_in_decay=settings.fold_in_decay,
+            fold_in_history_limit=settings.fold_in_history_limit,
+            num_item_neighbors=settings.item_neighbors_count,
+            exact_exclusion=settings.exact_exclusion
+        )
+
+    def _ensure_loaded(self) -> Tuple[EmbeddingRecommender, Optional[str]]:
+        current = self._current
+        if current is not None:
+            return current
+
+        with self._lock:
+            if self._current is None:
+                self._current = self._load_from_disk()
+            return self._current
+
+    def _load_from_disk(self) -> Tuple[EmbeddingRecommender, Optional[str]]:
+        """Load pre-trained model nếu có, nếu không trả về model rỗng"""
+        model = self.new_model()
+        version = None
+
+        try:
+            if current_version(self.model_path) is not None:
+                version = model.load(self.model_path, verify_checksums=settings.model_verify_checksums)
+                logger.info(f"Loaded TensorFlow Recommenders model (version {version})")
+            else:
+                logger.warning("No pre-trained model found. Need to train first.")
+        except Exception as e:
+            logger.error(f"Error loading model: {e}")
+            model = self.new_model()
+
+        return model, version
+
+    @property
+    def model(self) -> EmbeddingRecommender:
+        """Model đang serve"""
+        return self._ensure_loaded()[0]
+
+    @property
+    def version(self) -> Optional[str]:
+        """Version của model đang serve (None nếu chưa train)"""
+        return self._ensure_loaded()[1]
+
+    def snapshot(self) -> Tuple[EmbeddingRecommender, Optional[str]]:
+        """Lấy (model, version) cùng lúc, dùng khi cần cả hai nhất quán"""
+        return self._ensure_loaded()
+
+    def swap(self, model: EmbeddingRecommender, version: Optional[str] = None) -> str:
+        """
+        Thay model đang serve bằng model mới đã train xong
+
+        Requests đang chạy vẫn giữ reference tới model cũ cho tới khi xong,
+        requests mới sẽ thấy model mới ngay
+        """
+        if not model.is_trained:
+            raise ValueError("Cannot swap in a model that is not trained")
+
+        version = version or time.strftime("%Y%m%d%H%M%S", time.gmtime())
+
+        with self._lock:
+            self._current = (model, version)
+
+        logger.info(f"Swapped in new model version {version}")
+        return version
+
+    def reload(self) -> bool:
+        """Load lại model từ disk (vd: sau khi training process train xong)"""
+        model, version = self._load_from_disk()
+        if not model.is_trained:
+            return False
+
+        with self._lock:
+            self._current = (model, version)
+
+        logger.info(f"Reloaded model version {version} from disk")
+        return True
+
+    def check_for_update(self) -> bool:
+        """Reload nếu CURRENT trỏ tới version khác version đang serve, returns True nếu đã reload"""
+        current = self._current
+        if current is None:
+            # Chưa load lần nào, lần load đầu sẽ đọc version mới nhất
+            return False
+
+        disk_version = current_version(self.model_path)
+        if disk_version is None or disk_version == current[1]:
+            return False
+
+        logger.info(f"Model version {disk_version} found on disk (serving {current[1]}), reloading")
+        return self.reload()
+
+    def start_watching(self, interval_s: float):
+        """Background thread poll CURRENT mỗi interval_s giây"""
+        if self._watcher is not None:
+            return
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(interval_s,),
+            name="model-registry-watcher",
+            daemon=True
+        )
+        self._watcher.start()
+        logger.info(f"Watching {self.model_path} for new model versions every {interval_s}s")
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, interval_s: float):
+        while not self._stop_watching.wait(interval_s):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                logger.error(f"Error checking for new model version: {e}", exc_info=True)
+
+
+model_registry = ModelRegistry(
+    model_path=settings.model_path,
+    embedding_dim=settings.embedding_dim,
+    retrieval_backend=settings.retrieval_backend,
+    serving_mode=settings.serving_mode
+)
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.models.product import ProductRecommendation
+from app.services.redis_service import RedisService, TRENDING_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def popular_recommendations_from_ids(popular_ids: List[str]) -> List[ProductRecommendation]:
+    """Build ProductRecommendation list từ popular ids (score giảm dần theo ranking)"""
+    results = []
+    for idx, product_id in enumerate(popular_ids):
+        score = 0.4 - (idx * 0.02)  # Giảm dần theo ranking
+        results.append(ProductRecommendation(
+            product_id=product_id,
+            score=max(score, 0.2),
+            reason="popular"
+        ))
+
+    return results
+
+
+class PopularityRefresher:
+    """
+    Background thread giữ popular fallback luôn sẵn sàng
+
+    - Mỗi trending_interval_s materialize trending ranking (RedisService.refresh_trending),
+      nhiều replicas cùng chạy thì chỉ một replica refresh mỗi interval (Redis lock SET NX EX)
+    - Mỗi popular_interval_s load top popular_size products vào memory, kèm
+      ProductRecommendation đã build sẵn, để fallback không cần Redis round trip
+    """
+
+    LOCK_KEY = f"{TRENDING_KEY}:lock"
+
+    def __init__(
+        self,
+        trending_interval_s: float = 300.0,
+        popular_interval_s: float = 30.0,
+        popular_size: int = 100
+    ):
+        self.trending_interval_s = trending_interval_s
+        self.popular_interval_s = popular_interval_s
+        self.popular_size = popular_size
+        self.redis = RedisService()
+
+        # (ids, recommendations) được thay cả tuple một lần nên readers luôn thấy bản nhất quán
+        self._popular: Tuple[List[str], List[ProductRecommendation]] = ([], [])
+        self.popular_refreshed_at: Optional[float] = None
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="popularity-refresher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Popularity refresher started (trending every {self.trending_interval_s}s, "
+            f"popular list every {self.popular_interval_s}s)"
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh_trending(self) -> bool:
+        """Materialize trending nếu lấy được lock, returns True nếu đã refresh"""
+        # Lock hết hạn ngay trước interval tiếp theo để replica khác có thể nhận
+        ttl = max(1, int(self.trending_interval_s) - 1)
+        if not self.redis.client.set(self.LOCK_KEY, "1", nx=True, ex=ttl):
+            return False
+
+        size = self.redis.refresh_trending()
+        logger.info(f"Refreshed trending ranking with {size} products")
+        return True
+
+    def refresh_popular(self):
+        """Load top popular products từ Redis vào memory"""
+        popular_ids = self.redis.get_popular_products(limit=self.popular_size)
+        self._popular = (popular_ids, popular_recommendations_from_ids(popular_ids))
+        self.popular_refreshed_at = time.time()
+
+    def popular_ids(self, limit: int) -> Optional[List[str]]:
+        """Top popular ids từ memory, None nếu chưa load hoặc không đủ limit (caller hỏi Redis)"""
+        popular_ids, _ = self._popular
+        if not self._covers(popular_ids, limit):
+            return None
+        return popular_ids[:limit]
+
+    def popular_recommendations(self, limit: int) -> Optional[List[ProductRecommendation]]:
+        """Như popular_ids nhưng trả về ProductRecommendation đã build sẵn (không được sửa)"""
+        popular_ids, recommendations = self._popular
+        if not self._covers(popular_ids, limit):
+            return None
+        return recommendations[:limit]
+
+    def _covers(self, popular_ids: List[str], limit: int) -> bool:
+        # Danh sách ngắn hơn popular_size nghĩa là Redis chỉ có chừng đó products
+        if self.popular_refreshed_at is None:
+            return False
+        return limit <= len(popular_ids) or len(popular_ids) < self.popular_size
+
+    def _run(self):
+        next_trending = 0.0
+
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_trending:
+                    next_trending = time.monotonic() + self.trending_interval_s
+                    self.refresh_trending()
+            except Exception as e:
+                logger.error(f"Error refreshing trending: {e}", exc_info=True)
+
+            try:
+                self.refresh_popular()
+            except Exception as e:
+                # Giữ danh sách cũ khi Redis lỗi, fallback vẫn serve được
+                logger.error(f"Error refreshing popular products: {e}", exc_info=True)
+
+            self._stop.wait(self.popular_interval_s)
+
+
+popularity_refresher = PopularityRefresher(
+    trending_interval_s=settings.trending_refresh_interval_s,
+    popular_interval_s=settings.popular_refresh_interval_s,
+    popular_size=settings.popular_cache_size
+)
@@ -1,10 +1,98 @@
 import grpc
 import logging
+import os
+import sys
+import threading
 from typing import Optional, Dict, List
 from app.config import settings
+from app.services.local_cache import LocalCache
 
 logger = logging.getLogger(__name__)
 
+# apps/ml-service, relative product_proto_dir được resolve theo thư mục này (không theo cwd)
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Docker image copy product.proto vào {SERVICE_ROOT}/proto, khi dev thì đọc thẳng từ libs/proto
+DEFAULT_PROTO_DIRS = (
+    os.path.join(SERVICE_ROOT, "proto"),
+    os.path.join(SERVICE_ROOT, "..", "..", "libs", "proto", "src", "proto")
+)
+
+_channel: Optional[grpc.Channel] = None
+_channel_lock = threading.Lock()
+_proto_modules = None
+
+
+def _proto_dir() -> str:
+    """Thư mục chứa product.proto: product_proto_dir nếu có set, nếu không thì DEFAULT_PROTO_DIRS"""
+    if settings.product_proto_dir:
+        candidates = [os.path.join(SERVICE_ROOT, settings.product_proto_dir)]
+    else:
+        candidates = DEFAULT_PROTO_DIRS
+
+    for candidate in candidates:
+        if os.path.isfile(os.path.join(candidate, "product.proto")):
+            return os.path.normpath(candidate)
+
+    raise RuntimeError(f"product.proto not found in {', '.join(os.path.normpath(c) for c in candidates)}")
+
+
+def load_proto():
+    """
+    Load product.proto lúc runtime (grpc.protos_and_services, cần grpcio-tools)
+    nên không phải commit code generate từ libs/proto
+    Raise RuntimeError nếu không load được
+    Returns: (product_pb2, product_pb2_grpc)
+    """
+    global _proto_modules
+
+    if _proto_modules is None:
+        with _channel_lock:
+            if _proto_modules is None:
+                proto_dir = _proto_dir()
+                if proto_dir not in sys.path:
+                    sys.path.append(proto_dir)
+                try:
+                    _proto_modules = grpc.protos_and_services("product.proto")
+                except Exception as e:
+                    raise RuntimeError(f"Failed to load product.proto from {proto_dir}: {e}") from e
+    return _proto_modules
+
+
+def get_channel() -> grpc.Channel:
+    """gRPC channel dùng chung cho tất cả ProductServiceClient trong process (HTTP/2 multiplexing)"""
+    global _channel
+
+    if _channel is None:
+        with _channel_lock:
+            if _channel is None:
+                _channel = grpc.insecure_channel(
+                    settings.product_service_grpc_url,
+                    options=[
+                        ("grpc.keepalive_time_ms", 30000),
+                        ("grpc.keepalive_permit_without_calls", 1)
+                    ]
+                )
+    return _channel
+
+
+def close_channel():
+    """Đóng channel dùng chung (khi app shutdown)"""
+    global _channel
+
+    with _channel_lock:
+        if _channel is not None:
+            _channel.close()
+            _channel = None
+            logger.info("Product Service connection closed")
+
+
+# Product features ít thay đổi, cache trong process để không gọi lại Product Service
+product_cache = LocalCache(
+    max_size=settings.product_cache_max_size,
+    ttl_s=settings.product_cache_ttl_s,
+    name="product-cache"
+)
+
 
 class ProductServiceClient:
     """gRPC client để gọi Product Service"""
@@ -12,34 +100,55 @@ class ProductServiceClient:
     def __init__(self):
         self.channel = None
         self.stub = None
+        self.pb2 = None
 
     def connect(self):
-        """Kết nối tới Product Service"""
-        try:
-            self.channel = grpc.insecure_channel(settings.product_service_grpc_url)
-            # Import proto generated code (sẽ cần generate từ .proto files)
-            # self.stub = product_pb2_grpc.ProductServiceStub(self.channel)
-            logger.info(f"Connected to Product Service at {settings.product_service_grpc_url}")
-        except Exception as e:
-            logger.error(f"Failed to connect to Product Service: {e}")
+        """
+        Kết nối tới Product Service
+        Không load được proto là lỗi cấu hình/deploy nên raise luôn (app fail lúc startup)
+        thay vì mọi lookup âm thầm trả về rỗng
+        """
+        self.pb2, pb2_grpc = load_proto()
+        self.channel = get_channel()
+        self.stub = pb2_grpc.ProductServiceStub(self.channel)
+        logger.info(f"Connected to Product Service at {settings.product_service_grpc_url}")
+
+    @staticmethod
+    def _to_dict(response) -> Dict:
+        """GetProductResponse -> {id, name, category_id, brand_id, price}"""
+        prices = [sku.price for sku in response.skus if sku.price]
+        return {
+            'id': response.id,
+            'name': response.name,
+            'category_id': response.category.id,
+            'brand_id': response.brand.id,
+            'price': min(prices) if prices else response.originalPrice
+        }
 
     def get_product(self, product_id: str) -> Optional[Dict]:
         """
         Lấy thông tin product từ Product Service
-        Returns: {id, name, category_id, brand_id}
+        Returns: {id, name, category_id, brand_id, price}
         """
-        try:
-            # TODO: Implement gRPC call khi có proto
-            # request = product_pb2.GetProductRequest(id=product_id)
-            # response = self.stub.GetProduct(request)
-            # return response
+        cached = product_cache.get(product_id)
+        if cached is not None:
+            return cached
 
-            # Temporary: Return mock data
-            logger.warning(f"Mock call: get_product({product_id})")
+        if not self.stub:
+            logger.warning("Product Service client not connected")
             return None
 
+        try:
+            request = self.pb2.GetProductRequest(id=product_id)
+            response = self.stub.GetProduct(request, timeout=settings.product_service_timeout_s)
+
+            product = self._to_dict(response)
+            product_cache.set(product_id, product)
+            return product
+
         except grpc.RpcError as e:
-            logger.error(f"gRPC error calling GetProduct: {e}")
+            if e.code() != grpc.StatusCode.NOT_FOUND:
+                logger.error(f"gRPC error calling GetProduct: {e.code()} {e.details()}")
             return None
         except Exception as e:
             logger.error(f"Error calling GetProduct: {e}")
@@ -48,15 +157,48 @@ class ProductServiceClient:
     def get_products_by_ids(self, product_ids: List[str]) -> List[Dict]:
         """
         Lấy thông tin nhiều products
+        Proto không có batch RPC theo ids nên mỗi chunk gửi đồng thời các GetProduct
+        (futures trên cùng một channel), tối đa product_service_batch_size calls in-flight
         """
-        try:
-            # TODO: Implement batch get products
-            logger.warning(f"Mock call: get_products_by_ids({len(product_ids)} products)")
-            return []
+        products = []
+        missing = []
+        for product_id in dict.fromkeys(product_ids):
+            cached = product_cache.get(product_id)
+            if cached is not None:
+                products.append(cached)
+            else:
+                missing.append(product_id)
 
-        except Exception as e:
-            logger.error(f"Error calling get_products_by_ids: {e}")
-            return []
+        if not missing or not self.stub:
+            return products
+
+        chunk_size = settings.product_service_batch_size
+        failed = 0
+
+        for start in range(0, len(missing), chunk_size):
+            futures = [
+                self.stub.GetProduct.future(
+                    self.pb2.GetProductRequest(id=product_id),
+                    timeout=settings.product_service_timeout_s
+                )
+                for product_id in missing[start:start + chunk_size]
+            ]
+
+            for future in futures:
+                try:
+                    product = self._to_dict(future.result())
+                except grpc.RpcError as e:
+                    if e.code() != grpc.StatusCode.NOT_FOUND:
+                        failed += 1
+                    continue
+
+                product_cache.set(product['id'], product)
+                products.append(product)
+
+        if failed:
+            logger.warning(f"GetProduct failed for {failed}/{len(missing)} products")
+
+        return products
 
     def search_products(
         self,
@@ -65,19 +207,34 @@ class ProductServiceClient:
         limit: int = 10
     ) -> List[Dict]:
         """
-        Search products by category/brand
+        Search products by category/brand (GetProducts)
         """
-        try:
-            # TODO: Implement gRPC call
-            logger.warning(f"Mock call: search_products(category={category_id}, brand={brand_id})")
+        if not self.stub:
+            logger.warning("Product Service client not connected")
             return []
 
+        try:
+            request = self.pb2.GetAllProductsRequest(
+                page=1,
+                limit=limit,
+                categoryId=category_id or "",
+                brandId=brand_id or ""
+            )
+            response = self.stub.GetProducts(request, timeout=settings.product_service_timeout_s)
+
+            products = [self._to_dict(p) for p in response.products]
+            for product in products:
+                product_cache.set(product['id'], product)
+            return products
+
+        except grpc.RpcError as e:
+            logger.error(f"gRPC error calling GetProducts: {e.code()} {e.details()}")
+            return []
         except Exception as e:
             logger.error(f"Error calling search_products: {e}")
             return []
 
     def close(self):
-        """Đóng connection"""
-        if self.channel:
-            self.channel.close()
-            logger.info("Product Service connection closed")
\ No newline at end of file
+        """Bỏ reference tới channel (channel dùng chung, đóng bằng close_channel())"""
+        self.stub = None
+        self.channel = None
@@ -2,6 +2,9 @@ from typing import List, Dict, Optional
 import logging
 from app.config import settings
 from app.services.redis_service import RedisService
+from app.services.async_redis_service import AsyncRedisService
+from app.services.local_cache import recommendation_cache
+from app.services.popularity_service import popularity_refresher, popular_recommendations_from_ids
 from app.services.product_service_client import ProductServiceClient
 from app.services.tfrs_service import TFRSRecommendationService
 from app.models.product import ProductRecommendation
@@ -17,6 +20,7 @@ class RecommendationService:
 
     def __init__(self):
         self.redis = RedisService()
+        self.async_redis = AsyncRedisService()
         self.product_client = ProductServiceClient()
         self.product_client.connect()
 
@@ -46,17 +50,27 @@ class RecommendationService:
         self,
         user_id: str,
         current_product_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        use_cache: bool = True
     ) -> List[ProductRecommendation]:
         """
         AI-powered personalized recommendations using TensorFlow Recommenders
+        use_cache=False: bỏ qua cache read (vd: cache của user vừa bị invalidate), kết quả vẫn được cache
         """
 
-        # Check cache
-        cached = self.redis.get_recommendations_cache(user_id)
-        if cached:
-            logger.info(f"Returning cached recommendations for user {user_id}")
-            return [ProductRecommendation(**item) for item in cached[:limit]]
+        # Cache keys gắn với model version: model mới thì cache cũ tự hết hiệu lực
+        version = self.model_version
+
+        if use_cache:
+            # Check in-process cache, rồi tới Redis
+            local = self._get_local(version, user_id, limit)
+            if local is not None:
+                return local
+
+            cached = self.redis.get_recommendations_cache(user_id, version)
+            if cached:
+                logger.info(f"Returning cached recommendations for user {user_id}")
+                return self._set_local(version, user_id, cached)[:limit]
 
         recommendations: List[ProductRecommendation] = []
 
@@ -83,18 +97,205 @@ class RecommendationService:
         # Fallback to popular if not enough
         if len(recommendations) < limit:
             popular = self.get_popular_recommendations(limit=limit - len(recommendations))
-            existing_ids = {r.product_id for r in recommendations}
+            self._pad_with_popular(recommendations, popular)
+
+        # Cache results
+        cache_data = [rec.dict() for rec in recommendations[:limit]]
+        self.redis.save_recommendations_cache(
+            user_id,
+            cache_data,
+            model_version=version,
+            ttl=settings.recommendation_cache_ttl_s
+        )
+        self._set_local(version, user_id, recommendations[:limit])
+
+        return recommendations[:limit]
+
+    async def get_recommendations_for_user_async(
+        self,
+        user_id: str,
+        current_product_id: Optional[str] = None,
+        limit: int = 10
+    ) -> List[ProductRecommendation]:
+        """
+        Async version của get_recommendations_for_user cho FastAPI handlers
+        Tất cả Redis calls dùng AsyncRedisService nên không block event loop
+        """
+
+        # Cache keys gắn với model version: model mới thì cache cũ tự hết hiệu lực
+        version = self.model_version
+
+        # Check in-process cache, rồi tới Redis
+        local = self._get_local(version, user_id, limit)
+        if local is not None:
+            return local
+
+        cached = await self.async_redis.get_recommendations_cache(user_id, version)
+        if cached:
+            logger.info(f"Returning cached recommendations for user {user_id}")
+            return self._set_local(version, user_id, cached)[:limit]
+
+        recommendations: List[ProductRecommendation] = []
+
+        try:
+            # Get recommendations from TFRS model
+            tfrs_recs = await self.tfrs_service.get_recommendations_async(
+                user_id=user_id,
+                k=limit,
+                filter_viewed=True
+            )
+
+            for product_id, score in tfrs_recs:
+                recommendations.append(ProductRecommendation(
+                    product_id=product_id,
+                    score=score,
+                    reason="ai_personalized"
+                ))
+
+            logger.info(f"Got {len(recommendations)} TFRS recommendations for user {user_id}")
 
-            for prod in popular:
-                if prod.product_id not in existing_ids:
-                    recommendations.append(prod)
+        except Exception as e:
+            logger.error(f"TFRS recommendation failed: {e}", exc_info=True)
+
+        # Fallback to popular if not enough
+        if len(recommendations) < limit:
+            popular = popularity_refresher.popular_recommendations(limit - len(recommendations))
+            if popular is None:
+                popular_ids = await self.async_redis.get_popular_products(limit=limit - len(recommendations))
+                popular = self._popular_from_ids(popular_ids)
+            self._pad_with_popular(recommendations, popular)
 
         # Cache results
         cache_data = [rec.dict() for rec in recommendations[:limit]]
-        self.redis.save_recommendations_cache(user_id, cache_data, ttl=300)
+        await self.async_redis.save_recommendations_cache(
+            user_id,
+            cache_data,
+            model_version=version,
+            ttl=settings.recommendation_cache_ttl_s
+        )
+        self._set_local(version, user_id, recommendations[:limit])
 
         return recommendations[:limit]
 
+    def get_recommendations_for_users(
+        self,
+        user_ids: List[str],
+        limit: int = 10,
+        use_cache: bool = True
+    ) -> Dict[str, List[ProductRecommendation]]:
+        """
+        Batch version của get_recommendations_for_user
+        Cache lookup (MGET), model query và cache write đều làm một lần cho cả batch
+        use_cache=False: bỏ qua cache read cho cả batch (vd: users vừa bị invalidate)
+        """
+        results: Dict[str, List[ProductRecommendation]] = {}
+        version = self.model_version
+        cached: Dict[str, List[Dict]] = {}
+
+        if use_cache:
+            # Check in-process cache, rồi tới Redis (một MGET cho các users còn lại)
+            for user_id in user_ids:
+                local = self._get_local(version, user_id, limit)
+                if local is not None:
+                    results[user_id] = local
+
+            missing = [user_id for user_id in user_ids if user_id not in results]
+            cached = self.redis.get_recommendations_cache_many(missing, version)
+            for user_id, items in cached.items():
+                results[user_id] = self._set_local(version, user_id, items)[:limit]
+
+        missing = [user_id for user_id in user_ids if user_id not in results]
+        if not missing:
+            return results
+
+        tfrs_recs: Dict[str, List] = {}
+        try:
+            tfrs_recs = self.tfrs_service.get_recommendations_batch(
+                user_ids=missing,
+                k=limit,
+                filter_viewed=True
+            )
+        except Exception as e:
+            logger.error(f"TFRS batch recommendation failed: {e}", exc_info=True)
+
+        popular = None
+        to_cache: Dict[str, List[Dict]] = {}
+
+        for user_id in missing:
+            recommendations = [
+                ProductRecommendation(product_id=product_id, score=score, reason="ai_personalized")
+                for product_id, score in tfrs_recs.get(user_id, [])
+            ]
+
+            # Fallback to popular if not enough (popular chỉ lấy một lần cho cả batch)
+            if len(recommendations) < limit:
+                if popular is None:
+                    popular = self.get_popular_recommendations(limit=limit)
+                self._pad_with_popular(recommendations, popular)
+
+            results[user_id] = recommendations[:limit]
+            to_cache[user_id] = [rec.dict() for rec in results[user_id]]
+            self._set_local(version, user_id, results[user_id])
+
+        # Cache results
+        self.redis.save_recommendations_cache_many(
+            to_cache,
+            model_version=version,
+            ttl=settings.recommendation_cache_ttl_s
+        )
+
+        logger.info(f"Computed recommendations for {len(missing)} users ({len(cached)} cached)")
+        return results
+
+    @property
+    def model_version(self) -> Optional[str]:
+        """Version của model đang serve, dùng trong cache keys"""
+        return self.tfrs_service.registry.version
+
+    def invalidate_cached_recommendations(self, user_ids: List[str]):
+        """
+        Xoá cached recommendations (in-process + Redis) của users
+        Gọi khi history của user thay đổi (view mới), in-process cache của các
+        process khác được xoá qua pub/sub (xem CacheInvalidationListener)
+        """
+        version = self.model_version
+        recommendation_cache.invalidate_many((version, user_id) for user_id in user_ids)
+        self.redis.invalidate_recommendations_cache(user_ids, version)
+
+    @staticmethod
+    def _get_local(version: Optional[str], user_id: str, limit: int) -> Optional[List[ProductRecommendation]]:
+        """Lấy recommendations từ in-process cache (không Redis round trip, không JSON decode)"""
+        if not settings.local_cache_enabled:
+            return None
+
+        cached = recommendation_cache.get((version, user_id))
+        return cached[:limit] if cached is not None else None
+
+    @staticmethod
+    def _set_local(version: Optional[str], user_id: str, items: List) -> List[ProductRecommendation]:
+        """Lưu vào in-process cache, items là ProductRecommendation hoặc dict từ Redis"""
+        recommendations = [
+            item if isinstance(item, ProductRecommendation) else ProductRecommendation(**item)
+            for item in items
+        ]
+
+        if settings.local_cache_enabled:
+            recommendation_cache.set((version, user_id), recommendations)
+        return recommendations
+
+    @staticmethod
+    def _pad_with_popular(
+        recommendations: List[ProductRecommendation],
+        popular: List[ProductRecommendation]
+    ):
+        """Thêm popular products chưa có vào cuối danh sách recommendations"""
+        existing_ids = {r.product_id for r in recommendations}
+
+        for prod in popular:
+            if prod.product_id not in existing_ids:
+                recommendations.append(prod)
+                existing_ids.add(prod.product_id)
+
     def get_similar_products(
         self,
         product_id: str,
@@ -102,8 +303,16 @@ class RecommendationService:
     ) -> List[ProductRecommendation]:
         """
         Lấy similar products
+        Ưu tiên neighbor index precompute từ item embeddings (lookup in-memory)
         Fallback: dựa trên category/brand nếu model chưa có
         """
+        neighbors = self.tfrs_service.model.similar_products(product_id, k=limit)
+        if neighbors:
+            return [
+                ProductRecommendation(product_id=pid, score=score, reason="similar_embedding")
+                for pid, score in neighbors
+            ]
+
         product_info = self.get_product_info(product_id)
         if not product_info:
             return []
@@ -132,19 +341,18 @@ class RecommendationService:
 
 
     def get_popular_recommendations(self, limit: int = 10) -> List[ProductRecommendation]:
-        """Lấy popular products từ Redis"""
-        popular_ids = self.redis.get_popular_products(limit=limit)
+        """Lấy popular products từ memory (refresh nền), fallback Redis"""
+        popular = popularity_refresher.popular_recommendations(limit)
+        if popular is not None:
+            return popular
 
-        results = []
-        for idx, product_id in enumerate(popular_ids):
-            score = 0.4 - (idx * 0.02)  # Giảm dần theo ranking
-            results.append(ProductRecommendation(
-                product_id=product_id,
-                score=max(score, 0.2),
-                reason="popular"
-            ))
+        popular_ids = self.redis.get_popular_products(limit=limit)
+        return self._popular_from_ids(popular_ids)
 
-        return results
+    @staticmethod
+    def _popular_from_ids(popular_ids: List[str]) -> List[ProductRecommendation]:
+        """Build ProductRecommendation list từ popular ids (score giảm dần theo ranking)"""
+        return popular_recommendations_from_ids(popular_ids)
 
     def close(self):
         """Close connections"""
@@ -1,29 +1,169 @@
 import redis
 import json
-from typing import List, Optional, Dict
+import threading
+import time
+from typing import Iterator, List, Optional, Dict, Tuple
 from app.config import settings
 
 
+_pool: Optional[redis.ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> redis.ConnectionPool:
+    """Connection pool dùng chung cho tất cả RedisService trong process"""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Blocking pool: hết connection thì chờ thay vì raise ngay
+                _pool = redis.BlockingConnectionPool(
+                    host=settings.redis_host,
+                    port=settings.redis_port,
+                    db=settings.redis_db,
+                    decode_responses=True,
+                    max_connections=settings.redis_max_connections,
+                    timeout=5
+                )
+    return _pool
+
+
+# Features lưu dạng hash chỉ có string values, các field này được parse lại thành float
+PRODUCT_FLOAT_FIELDS = ("price",)
+
+
+def product_features_key(product_id: str) -> str:
+    """Key features của product, hash dùng prefix riêng để không WRONGTYPE khi đổi storage"""
+    if settings.product_features_storage == "hash":
+        return f"product:features:h:{product_id}"
+    return f"product:features:{product_id}"
+
+
+def encode_product_hash(features: Dict) -> Dict[str, str]:
+    """Features -> hash fields (bỏ 'id' vì đã có trong key, bỏ giá trị None)"""
+    return {
+        field: str(value)
+        for field, value in features.items()
+        if field != "id" and value is not None
+    }
+
+
+def decode_product_hash(product_id: str, fields: Dict[str, str]) -> Dict:
+    """Hash fields -> features"""
+    features: Dict = {"id": product_id, **fields}
+    for field in PRODUCT_FLOAT_FIELDS:
+        if field in features:
+            features[field] = float(features[field])
+    return features
+
+
+TRENDING_KEY = "product:trending"
+# Set cũ (trước khi có time buckets), không còn được đọc, xoá ở lần refresh trending đầu tiên
+LEGACY_POPULARITY_KEY = "product:popularity"
+
+
+def popularity_bucket_key(bucket: int) -> str:
+    return f"popularity:bucket:{bucket}"
+
+
+def trending_key(category_id: Optional[str] = None) -> str:
+    """Trending set toàn bộ hoặc theo category"""
+    return f"{TRENDING_KEY}:cat:{category_id}" if category_id else TRENDING_KEY
+
+
+def category_products_key(category_id: str) -> str:
+    """Sorted set products của category, score = lần cuối thấy product trong category"""
+    return f"category:products:{category_id}"
+
+
+def popularity_window_s() -> int:
+    """Độ dài window của trending, cũng là TTL của trending và category keys"""
+    return settings.popularity_bucket_s * settings.popularity_window_buckets
+
+
+def recommendations_cache_key(user_id: str, model_version: Optional[str]) -> str:
+    """
+    Key cache recommendations, gắn với model version
+    Model mới có key mới nên cache cũ tự hết hiệu lực (không cần mass DEL)
+    """
+    return f"recommendations:{model_version or 'none'}:{user_id}"
+
+
+# Processes publish user ids vừa bị invalidate, mọi process xoá in-process cache của users đó
+RECOMMENDATIONS_INVALIDATION_CHANNEL = "recommendations:invalidate"
+
+
+def decode_recommendations(data: str) -> List[Dict]:
+    """
+    Decode cached recommendations
+    Payload là list items, hoặc {"model_version": ..., "items": [...]} nếu được precompute
+    """
+    payload = json.loads(data)
+    if isinstance(payload, dict):
+        return payload.get("items", [])
+    return payload
+
+
 class RedisService:
     """Service để lưu user history và product features"""
 
     def __init__(self):
-        self.client = redis.Redis(
-            host=settings.redis_host,
-            port=settings.redis_port,
-            db=settings.redis_db,
-            decode_responses=True
-        )
+        self.client = redis.Redis(connection_pool=get_connection_pool())
 
     def add_user_view(self, user_id: str, product_id: str, timestamp: int):
         """Thêm product vào history của user"""
         key = f"user:history:{user_id}"
 
+        pipe = self.client.pipeline(transaction=False)
+
         # Add to sorted set (score = timestamp)
-        self.client.zadd(key, {product_id: timestamp})
+        pipe.zadd(key, {product_id: timestamp})
 
         # Keep only last N items
-        self.client.zremrangebyrank(key, 0, -(settings.user_history_limit + 1))
+        pipe.zremrangebyrank(key, 0, -(settings.user_history_limit + 1))
+
+        pipe.execute()
+
+    def record_views(self, views: List[Tuple[str, str, int]]):
+        """
+        Ghi một batch views (user_id, product_id, timestamp) trong một pipeline:
+        thêm vào history, trim history, tăng popularity
+        """
+        if not views:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+
+        for user_id, product_id, timestamp in views:
+            key = f"user:history:{user_id}"
+            pipe.zadd(key, {product_id: timestamp})
+            pipe.zremrangebyrank(key, 0, -(settings.user_history_limit + 1))
+
+        self._count_views(pipe, [(product_id, timestamp) for _, product_id, timestamp in views])
+        pipe.execute()
+
+    @staticmethod
+    def _count_views(pipe, views: List[Tuple[str, int]]):
+        """
+        Tăng view count trong popularity bucket của từng view (theo timestamp của view)
+        Bucket tự expire sau popularity window nên memory không tăng mãi
+        """
+        bucket_s = settings.popularity_bucket_s
+        oldest = int(time.time()) // bucket_s - settings.popularity_window_buckets + 1
+        buckets = set()
+
+        for product_id, timestamp in views:
+            bucket = int(timestamp) // bucket_s
+            if bucket < oldest:
+                continue  # View quá cũ, nằm ngoài window
+
+            pipe.zincrby(popularity_bucket_key(bucket), 1, product_id)
+            buckets.add(bucket)
+
+        ttl = (settings.popularity_window_buckets + 1) * bucket_s
+        for bucket in buckets:
+            pipe.expire(popularity_bucket_key(bucket), ttl)
 
     def get_user_history(self, user_id: str, limit: int = 10) -> List[str]:
         """Lấy history của user (recent first)"""
@@ -33,41 +173,319 @@ class RedisService:
         product_ids = self.client.zrevrange(key, 0, limit - 1)
         return list(product_ids)
 
+    def get_user_histories(
+        self,
+        user_ids: List[str],
+        limit: int = 10,
+        since: Optional[int] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Lấy history của nhiều users trong một pipeline (một round trip)
+        since: chỉ lấy views có timestamp >= since
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            key = f"user:history:{user_id}"
+            if since is None:
+                pipe.zrevrange(key, 0, limit - 1)
+            else:
+                pipe.zrevrangebyscore(key, "+inf", since, start=0, num=limit)
+
+        return {
+            user_id: list(product_ids)
+            for user_id, product_ids in zip(user_ids, pipe.execute())
+        }
+
+    def iter_user_histories(
+        self,
+        limit: int = 100,
+        chunk_size: int = 500,
+        since: Optional[int] = None
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Duyệt history của tất cả users bằng SCAN (không block Redis như KEYS)
+        History được lấy theo chunk, mỗi chunk một pipeline
+        since: chỉ lấy views có timestamp >= since
+        Yields: (user_id, product_ids) recent first
+        """
+        chunk: List[str] = []
+
+        for key in self.client.scan_iter(match="user:history:*", count=chunk_size):
+            chunk.append(key.split(":", 2)[-1])
+
+            if len(chunk) >= chunk_size:
+                yield from self.get_user_histories(chunk, limit=limit, since=since).items()
+                chunk = []
+
+        if chunk:
+            yield from self.get_user_histories(chunk, limit=limit, since=since).items()
+
+    def iter_active_user_histories(
+        self,
+        active_since: int,
+        limit: int = 100,
+        chunk_size: int = 500
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Duyệt users có view gần nhất với timestamp >= active_since (SCAN + pipeline)
+        Yields: (user_id, product_ids) recent first, history đầy đủ tới limit
+        """
+        chunk: List[str] = []
+
+        def fetch(user_ids: List[str]) -> Iterator[Tuple[str, List[str]]]:
+            pipe = self.client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.zrevrange(f"user:history:{user_id}", 0, limit - 1, withscores=True)
+
+            for user_id, items in zip(user_ids, pipe.execute()):
+                if items and items[0][1] >= active_since:
+                    yield user_id, [product_id for product_id, _ in items]
+
+        for key in self.client.scan_iter(match="user:history:*", count=chunk_size):
+            chunk.append(key.split(":", 2)[-1])
+
+            if len(chunk) >= chunk_size:
+                yield from fetch(chunk)
+                chunk = []
+
+        if chunk:
+            yield from fetch(chunk)
+
     def save_product_features(self, product_id: str, features: Dict):
         """Lưu features của product để tính similarity"""
-        key = f"product:features:{product_id}"
-        self.client.setex(key, 86400, json.dumps(features))  # TTL 24h
+        self.save_product_features_many({product_id: features})
+
+    def save_product_features_many(self, products: Dict[str, Dict], chunk_size: int = 1000):
+        """
+        Lưu features của nhiều products (json hoặc hash, theo settings)
+        Mỗi chunk_size products một pipeline
+        """
+        if not products:
+            return
+
+        ttl = settings.product_features_ttl_s
+        items = list(products.items())
+
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            pipe = self.client.pipeline(transaction=False)
+
+            if settings.trending_per_category:
+                self._index_categories(pipe, chunk)
+
+            for product_id, features in chunk:
+                key = product_features_key(product_id)
+
+                if settings.product_features_storage == "hash":
+                    pipe.delete(key)
+                    pipe.hset(key, mapping=encode_product_hash(features))
+                    if ttl:
+                        pipe.expire(key, ttl)
+                elif ttl:
+                    pipe.setex(key, ttl, json.dumps(features))
+                else:
+                    pipe.set(key, json.dumps(features))
+
+            pipe.execute()
+
+    def _index_categories(self, pipe, chunk: List[Tuple[str, Dict]]):
+        """
+        Products theo category, dùng để tính trending theo category
+        Chỉ ghi (không đọc category cũ): product đổi category hoặc không còn được
+        lưu lại (vd: đã xoá) hết hạn khỏi category cũ sau popularity window
+        """
+        now = int(time.time())
+        window_s = popularity_window_s()
+
+        for product_id, features in chunk:
+            category_id = features.get('category_id')
+            if category_id:
+                key = category_products_key(category_id)
+                pipe.zadd(key, {product_id: now})
+                pipe.expire(key, window_s)
 
     def get_product_features(self, product_id: str) -> Optional[Dict]:
         """Lấy features của product"""
-        key = f"product:features:{product_id}"
-        data = self.client.get(key)
+        return self.get_product_features_many([product_id]).get(product_id)
 
-        if data:
-            return json.loads(data)
-        return None
+    def get_product_features_many(self, product_ids: List[str], chunk_size: int = 1000) -> Dict[str, Dict]:
+        """
+        Lấy features của nhiều products, mỗi chunk_size products một round trip
+        json: MGET, hash: pipelined HGETALL
+        Returns: {product_id: features} chỉ gồm products có trong cache
+        """
+        if len(product_ids) > chunk_size:
+            features: Dict[str, Dict] = {}
+            for start in range(0, len(product_ids), chunk_size):
+                features.update(self.get_product_features_many(product_ids[start:start + chunk_size], chunk_size))
+            return features
+
+        if not product_ids:
+            return {}
+
+        keys = [product_features_key(product_id) for product_id in product_ids]
+
+        if settings.product_features_storage == "hash":
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+
+            return {
+                product_id: decode_product_hash(product_id, fields)
+                for product_id, fields in zip(product_ids, pipe.execute())
+                if fields
+            }
+
+        return {
+            product_id: json.loads(data)
+            for product_id, data in zip(product_ids, self.client.mget(keys))
+            if data
+        }
 
     def increment_product_view_count(self, product_id: str):
         """Tăng view count cho product (để tính popularity)"""
-        key = "product:popularity"
-        self.client.zincrby(key, 1, product_id)
+        pipe = self.client.pipeline(transaction=False)
+        self._count_views(pipe, [(product_id, int(time.time()))])
+        pipe.execute()
 
-    def get_popular_products(self, limit: int = 10) -> List[str]:
-        """Lấy top popular products"""
-        key = "product:popularity"
-        product_ids = self.client.zrevrange(key, 0, limit - 1)
-        return list(product_ids)
+    def refresh_trending(self, now: Optional[float] = None) -> int:
+        """
+        Materialize trending ranking từ các popularity buckets trong window
+        Bucket có trọng số 0.5^(age / half_life) nên views gần đây quan trọng hơn
+        ZUNIONSTORE ghi đè trending set trong một lệnh, readers không thấy trạng thái dở
+        Returns: số products trong trending
+        """
+        bucket_s = settings.popularity_bucket_s
+        current = int(now if now is not None else time.time()) // bucket_s
+
+        weights = {
+            popularity_bucket_key(bucket): 0.5 ** ((current - bucket) * bucket_s / settings.popularity_half_life_s)
+            for bucket in range(current - settings.popularity_window_buckets + 1, current + 1)
+        }
+
+        pipe = self.client.pipeline(transaction=False)
+        for key in weights:
+            pipe.exists(key)
+        weights = {key: weight for (key, weight), exists in zip(weights.items(), pipe.execute()) if exists}
+
+        if not weights:
+            # Không có view nào trong window: bỏ ranking cũ thay vì serve trending của nhiều tuần trước
+            self._clear_trending()
+            return 0
+
+        window_s = popularity_window_s()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zunionstore(TRENDING_KEY, weights)
+        pipe.zremrangebyrank(TRENDING_KEY, 0, -(settings.trending_max_size + 1))
+        pipe.expire(TRENDING_KEY, window_s)
+        pipe.delete(LEGACY_POPULARITY_KEY)
+        pipe.zcard(TRENDING_KEY)
+        size = pipe.execute()[-1]
+
+        if settings.trending_per_category:
+            self._refresh_category_trending(current * bucket_s - window_s)
+
+        return size
+
+    def _refresh_category_trending(self, active_since: int, chunk_size: int = 500):
+        """
+        Trending theo category = trending ∩ products của category (score giữ nguyên của trending)
+        Products không được thấy trong category từ active_since bị bỏ khỏi category
+        """
+        window_s = popularity_window_s()
+        pipe = self.client.pipeline(transaction=False)
+        count = 0
+
+        for key in self.client.scan_iter(match=category_products_key("*"), count=chunk_size):
+            category_id = key.split(":", 2)[-1]
+            pipe.zremrangebyscore(key, "-inf", f"({active_since}")
+            # Category rỗng sau khi trim: ZINTERSTORE xoá luôn trending key của category
+            pipe.zinterstore(trending_key(category_id), {TRENDING_KEY: 1, key: 0})
+            pipe.expire(trending_key(category_id), window_s)
+            count += 1
+
+            if count % chunk_size == 0:
+                pipe.execute()
 
-    def save_recommendations_cache(self, user_id: str, recommendations: List[Dict], ttl: int = 300):
-        """Cache recommendations cho user (5 phút)"""
-        key = f"recommendations:{user_id}"
-        self.client.setex(key, ttl, json.dumps(recommendations))
+        pipe.execute()
 
-    def get_recommendations_cache(self, user_id: str) -> Optional[List[Dict]]:
-        """Lấy cached recommendations"""
-        key = f"recommendations:{user_id}"
+    def _clear_trending(self, chunk_size: int = 500):
+        """Xoá trending toàn bộ và theo category"""
+        keys = [TRENDING_KEY]
+        keys.extend(self.client.scan_iter(match=trending_key("*"), count=chunk_size))
+
+        for start in range(0, len(keys), chunk_size):
+            self.client.delete(*keys[start:start + chunk_size])
+
+    def get_popular_products(self, limit: int = 10, category_id: Optional[str] = None) -> List[str]:
+        """Lấy top popular products (trending đã materialize)"""
+        return list(self.client.zrevrange(trending_key(category_id), 0, limit - 1))
+
+    def save_recommendations_cache(
+        self,
+        user_id: str,
+        recommendations: List[Dict],
+        model_version: Optional[str],
+        ttl: int = 3600
+    ):
+        """Cache recommendations cho user theo model version"""
+        key = recommendations_cache_key(user_id, model_version)
+        payload = {"model_version": model_version, "items": recommendations}
+        self.client.setex(key, ttl, json.dumps(payload))
+
+    def save_recommendations_cache_many(
+        self,
+        recommendations: Dict[str, List[Dict]],
+        model_version: Optional[str],
+        ttl: int = 3600
+    ):
+        """
+        Cache recommendations cho nhiều users trong một pipeline
+        Payload được tag {"model_version": ..., "items": [...]}
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, items in recommendations.items():
+            payload = {"model_version": model_version, "items": items}
+            pipe.setex(recommendations_cache_key(user_id, model_version), ttl, json.dumps(payload))
+        pipe.execute()
+
+    def get_recommendations_cache(self, user_id: str, model_version: Optional[str]) -> Optional[List[Dict]]:
+        """Lấy cached recommendations của model version hiện tại"""
+        key = recommendations_cache_key(user_id, model_version)
         data = self.client.get(key)
 
         if data:
-            return json.loads(data)
-        return None
\ No newline at end of file
+            return decode_recommendations(data)
+        return None
+
+    def invalidate_recommendations_cache(self, user_ids: List[str], model_version: Optional[str]):
+        """
+        Xoá cached recommendations của users (vd: khi có view mới)
+        và broadcast để các process khác xoá in-process cache (xem CacheInvalidationListener)
+        """
+        if not user_ids:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*[recommendations_cache_key(user_id, model_version) for user_id in user_ids])
+        pipe.publish(
+            RECOMMENDATIONS_INVALIDATION_CHANNEL,
+            json.dumps({"model_version": model_version, "user_ids": user_ids})
+        )
+        pipe.execute()
+
+    def get_recommendations_cache_many(
+        self,
+        user_ids: List[str],
+        model_version: Optional[str]
+    ) -> Dict[str, List[Dict]]:
+        """Lấy cached recommendations của nhiều users bằng một MGET"""
+        if not user_ids:
+            return {}
+
+        values = self.client.mget([recommendations_cache_key(user_id, model_version) for user_id in user_ids])
+        return {
+            user_id: decode_recommendations(data)
+            for user_id, data in zip(user_ids, values)
+            if data
+        }
\ No newline at end of file
@@ -0,0 +1,98 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RequestBatcher:
+    """
+    Gom nhiều requests đồng thời thành một batch để xử lý một lần
+
+    - Caller gọi submit() và nhận Future
+    - Worker thread gom requests trong tối đa max_wait_ms (hoặc tới max_batch_size)
+      rồi gọi handler(items) một lần, kết quả được trả về từng Future
+    - handler(items) phải trả về list kết quả cùng thứ tự với items
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        name: str = "request-batcher"
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Đưa một request vào batch tiếp theo"""
+        self._ensure_started()
+
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect_batch(self) -> List[Tuple[Any, Future]]:
+        # Block tới khi có request đầu tiên, sau đó gom thêm trong cửa sổ max_wait
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+
+            try:
+                results = self.handler(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(batch)} in {self.name}: {e}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize()
+        }
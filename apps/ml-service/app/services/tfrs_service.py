@@ -1,13 +1,65 @@
+import asyncio
 import logging
 import os
-from typing import List, Dict, Optional, Tuple
-from app.models.tfrs_model import ProductRecommender
+import shutil
+import time
+import uuid
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple
+from app.models.embedding_recommender import EmbeddingRecommender
+from fastapi.concurrency import run_in_threadpool
 from app.services.redis_service import RedisService
+from app.services.async_redis_service import AsyncRedisService
 from app.services.product_service_client import ProductServiceClient
+from app.services.model_registry import model_registry
+from app.services.popularity_service import popularity_refresher
+from app.services.request_batcher import RequestBatcher
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
+def _fold_in_histories(histories: List[Optional[List[str]]]) -> Optional[List[Optional[List[str]]]]:
+    """Histories truyền vào model để fold-in users mới (None nếu fold-in bị tắt)"""
+    return histories if settings.fold_in_enabled else None
+
+
+def _fetch_k(model: EmbeddingRecommender, k: int) -> int:
+    """
+    Số candidates cần query để còn đủ k sau khi filter products đã xem
+    Exact exclusion mask trước top-k nên không cần over-fetch
+    """
+    return k if model.exact_exclusion else k * 2
+
+
+def _score_batch(
+    requests: List[Tuple[str, int, Optional[set], Optional[List[str]]]]
+) -> List[List[Tuple[str, float]]]:
+    """
+    Score cả batch (user_id, k, filter_products, history) bằng một lần query index
+    Dùng k lớn nhất trong batch rồi cắt lại theo k của từng request
+    """
+    model = model_registry.model
+    k = max(request[1] for request in requests)
+
+    results = model.recommend_batch(
+        user_ids=[request[0] for request in requests],
+        k=k,
+        filter_products=[request[2] for request in requests],
+        histories=_fold_in_histories([request[3] for request in requests])
+    )
+
+    return [recs[:request[1]] for recs, request in zip(results, requests)]
+
+
+# Batcher dùng chung toàn process, gom single-user queries đồng thời thành một matmul
+recommendation_batcher = RequestBatcher(
+    _score_batch,
+    max_batch_size=settings.request_batch_max_size,
+    max_wait_ms=settings.request_batch_max_wait_ms,
+    name="recommendation-batcher"
+)
+
+
 class TFRSRecommendationService:
     """
     TensorFlow Recommenders service
@@ -16,62 +68,57 @@ class TFRSRecommendationService:
 
     def __init__(self):
         self.redis = RedisService()
+        self.async_redis = AsyncRedisService()
         self.product_client = ProductServiceClient()
         self.product_client.connect()
 
-        self.model = ProductRecommender(embedding_dim=64)
-        self.model_path = "models/tfrs_recommender"
+        # Model dùng chung toàn process, xem ModelRegistry
+        self.registry = model_registry
 
-        # Load pre-trained model
-        self._load_model()
+    @property
+    def model(self) -> EmbeddingRecommender:
+        """Model đang serve (luôn lấy từ registry để thấy model mới nhất)"""
+        return self.registry.model
 
-    def _load_model(self):
-        """Load pre-trained model nếu có"""
-        try:
-            if os.path.exists(f"{self.model_path}_model"):
-                self.model.load(self.model_path)
-                logger.info("Loaded TensorFlow Recommenders model")
-            else:
-                logger.warning("No pre-trained model found. Need to train first.")
-        except Exception as e:
-            logger.error(f"Error loading model: {e}")
+    @property
+    def model_path(self) -> str:
+        return self.registry.model_path
 
-    def collect_training_data(self) -> Tuple[List[Dict], List[Dict]]:
+    def iter_interactions(self, history_limit: int = 100, since: Optional[int] = None) -> Iterator[Dict]:
         """
-        Collect training data from Redis và Product Service
+        Stream user interactions từ Redis (SCAN + pipelined history fetch)
+        Memory không phụ thuộc số users
+        since: chỉ lấy views có timestamp >= since (incremental training)
+        Yields: {'user_id': ..., 'product_id': ...}
         """
-        logger.info("Collecting training data...")
-
-        # 1. Get user interactions from Redis
-        interactions = []
-        user_keys = self.redis.client.keys("user:history:*")
-
-        for user_key in user_keys:
-            user_id = user_key.split(":")[-1]
-            product_ids = self.redis.get_user_history(user_id, limit=100)
-
+        for user_id, product_ids in self.redis.iter_user_histories(limit=history_limit, since=since):
             for product_id in product_ids:
-                interactions.append({
+                yield {
                     'user_id': user_id,
                     'product_id': product_id
-                })
+                }
 
-        logger.info(f"Collected {len(interactions)} interactions from {len(user_keys)} users")
+    def collect_products(self, product_ids: Iterable[str]) -> List[Dict]:
+        """
+        Lấy features của products từ Product Service, fallback Redis cache
+        """
+        unique_product_ids = list(set(product_ids))
 
-        # 2. Get product info
-        unique_product_ids = list(set([i['product_id'] for i in interactions]))
-        products = []
+        # Batch get products from Product Service, index theo id
+        products_by_id = {
+            p['id']: p for p in self.product_client.get_products_by_ids(unique_product_ids)
+        }
 
-        # Batch get products from Product Service
-        products_data = self.product_client.get_products_by_ids(unique_product_ids)
+        # Cache lại vào Redis để lần sau có fallback
+        self.redis.save_product_features_many(products_by_id)
 
-        # Fallback: get from Redis cache
-        for product_id in unique_product_ids:
-            product = next((p for p in products_data if p['id'] == product_id), None)
+        # Fallback: Redis cache cho products Product Service không trả về (một round trip)
+        missing = [product_id for product_id in unique_product_ids if product_id not in products_by_id]
+        products_by_id.update(self.redis.get_product_features_many(missing))
 
-            if not product:
-                # Try Redis cache
-                product = self.redis.get_product_features(product_id)
+        products = []
+        for product_id in unique_product_ids:
+            product = products_by_id.get(product_id)
 
             if product:
                 products.append({
@@ -80,47 +127,186 @@ class TFRSRecommendationService:
                     'brand_id': product.get('brand_id', '')
                 })
 
-        logger.info(f"Collected {len(products)} products")
+        return products
+
+    def export_training_data(
+        self,
+        output_dir: str,
+        since: Optional[int] = None
+    ) -> Tuple[List[str], int, Set[str]]:
+        """
+        Stream interactions từ Redis ra các shard TSV "user_id<TAB>product_id"
+        since: chỉ export views có timestamp >= since
+        Returns: (shard_paths, num_interactions, product_ids)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Xoá shards cũ nếu output_dir được dùng lại
+        for name in os.listdir(output_dir):
+            if name.startswith("interactions-"):
+                os.remove(os.path.join(output_dir, name))
 
-        return interactions, products
+        shard_paths: List[str] = []
+        product_ids: Set[str] = set()
+        num_interactions = 0
+        shard = None
 
-    def train_model(self, epochs: int = 5):
+        try:
+            for interaction in self.iter_interactions(since=since):
+                if num_interactions % settings.training_shard_size == 0:
+                    if shard:
+                        shard.close()
+                    path = os.path.join(output_dir, f"interactions-{len(shard_paths):05d}.tsv")
+                    shard = open(path, 'w', encoding='utf-8')
+                    shard_paths.append(path)
+
+                shard.write(f"{interaction['user_id']}\t{interaction['product_id']}\n")
+                product_ids.add(interaction['product_id'])
+                num_interactions += 1
+        finally:
+            if shard:
+                shard.close()
+
+        return shard_paths, num_interactions, product_ids
+
+    def train_model(
+        self,
+        epochs: int = 5,
+        callbacks: Optional[List] = None,
+        incremental: bool = False,
+        data_dir: Optional[str] = None
+    ):
         """
         Train TensorFlow Recommenders model
+        callbacks: Keras callbacks truyền vào fit() (progress, cancel)
+        incremental: warm-start từ model hiện tại và chỉ fine-tune trên
+            interactions mới kể từ lần train trước
+        data_dir: thư mục shards của lần train này (mặc định một thư mục mới
+            trong training_data_dir), bị xoá sau khi train xong
         """
-        logger.info("Starting model training...")
+        data_dir = data_dir or os.path.join(settings.training_data_dir, uuid.uuid4().hex)
+        try:
+            return self._train_model(epochs, callbacks, incremental, data_dir)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    def _train_model(self, epochs: int, callbacks: Optional[List], incremental: bool, data_dir: str):
+        previous = None
+        if incremental:
+            current = self.model
+            if current.is_trained and current.trained_at is not None:
+                previous = current
+            else:
+                logger.warning("No previous model to warm-start from. Running full training.")
+
+        since = previous.trained_at if previous else None
+        logger.info(f"Starting {'incremental' if previous else 'full'} model training...")
+
+        # Mốc thời gian của data, lần incremental sau bắt đầu từ đây
+        collected_at = int(time.time())
 
-        # Collect data
-        interactions, products = self.collect_training_data()
+        # Collect data: interactions stream ra shards trên disk, không giữ trong memory
+        shard_paths, num_interactions, product_ids = self.export_training_data(data_dir, since=since)
+        logger.info(f"Exported {num_interactions} interactions to {len(shard_paths)} shards")
 
-        if len(interactions) < 50:
+        if previous:
+            if num_interactions == 0:
+                logger.info("No new interactions since last training. Keeping current model.")
+                return True
+        elif num_interactions < 50:
             logger.error("Not enough interactions to train. Need at least 50.")
             return False
 
-        if len(products) < 10:
+        products = self.collect_products(product_ids)
+        logger.info(f"Collected {len(products)} products")
+
+        # Incremental: catalog cũ đã có sẵn trong model trước
+        if not previous and len(products) < 10:
             logger.error("Not enough products to train. Need at least 10.")
             return False
 
         try:
-            # Train model
-            self.model.prepare_and_train(
-                interactions=interactions,
+            # Train model mới riêng biệt, model đang serve không bị ảnh hưởng
+            model = self.registry.new_model(trainable=True)
+            model.prepare_and_train(
                 products=products,
+                interaction_shards=shard_paths,
                 epochs=epochs,
-                batch_size=2048
+                batch_size=settings.training_batch_size,
+                shuffle_buffer_size=settings.training_shuffle_buffer_size,
+                callbacks=callbacks,
+                warm_start=previous
             )
+            model.trained_at = collected_at
+
+            # Save model (artifact version mới)
+            version = model.save(self.model_path, keep_versions=settings.model_keep_versions)
 
-            # Save model
-            os.makedirs("models", exist_ok=True)
-            self.model.save(self.model_path)
+            # Swap vào registry để serving dùng ngay
+            # (cùng version với serving process khi nó reload model từ disk)
+            version = self.registry.swap(model, version)
 
-            logger.info("Model training completed and saved!")
+            logger.info(f"Model training completed and saved! Serving version {version}")
             return True
 
         except Exception as e:
             logger.error(f"Error during training: {e}", exc_info=True)
             return False
 
+    def precompute_recommendations(self) -> int:
+        """
+        Precompute recommendations cho users active gần đây (sau mỗi lần train)
+        Score theo batch lớn, loại products đã xem, ghi Redis bằng pipeline,
+        payload được tag model version
+        Returns: số users đã precompute
+        """
+        model, version = self.registry.snapshot()
+        if not model.is_trained:
+            logger.warning("Model not trained. Skipping precompute.")
+            return 0
+
+        active_since = int(time.time()) - settings.precompute_active_window_s
+        limit = settings.precompute_limit
+        started_at = time.monotonic()
+        total = 0
+
+        def flush(batch: List[Tuple[str, List[str]]]) -> int:
+            histories = [history for _, history in batch]
+            results = model.recommend_batch(
+                user_ids=[user_id for user_id, _ in batch],
+                k=_fetch_k(model, limit),
+                filter_products=[set(history) for history in histories],
+                histories=_fold_in_histories(histories)
+            )
+            payloads = {
+                user_id: [
+                    {"product_id": product_id, "score": score, "reason": "ai_personalized"}
+                    for product_id, score in recs[:limit]
+                ]
+                for (user_id, _), recs in zip(batch, results)
+                if recs
+            }
+            self.redis.save_recommendations_cache_many(
+                payloads,
+                model_version=version,
+                ttl=settings.precompute_cache_ttl_s
+            )
+            return len(payloads)
+
+        batch: List[Tuple[str, List[str]]] = []
+        for user_id, history in self.redis.iter_active_user_histories(active_since, limit=100):
+            batch.append((user_id, history))
+            if len(batch) >= settings.precompute_batch_size:
+                total += flush(batch)
+                batch = []
+
+        if batch:
+            total += flush(batch)
+
+        elapsed = time.monotonic() - started_at
+        logger.info(f"Precomputed recommendations for {total} users (model {version}) in {elapsed:.1f}s")
+        return total
+
     def get_recommendations(
         self,
         user_id: str,
@@ -130,23 +316,33 @@ class TFRSRecommendationService:
         """
         Get personalized recommendations cho user
         """
-        if not self.model.is_trained:
+        # Giữ reference tới model hiện tại cho cả request (tránh đổi model giữa chừng)
+        model = self.model
+
+        if not model.is_trained:
             logger.warning("Model not trained. Returning popular products.")
             return self._get_popular_fallback(k)
 
         try:
-            # Get user history để filter
+            # Get user history để filter (và fold-in nếu user chưa có trong model)
+            history = None
             filter_products = None
             if filter_viewed:
                 history = self.redis.get_user_history(user_id, limit=100)
                 filter_products = set(history) if history else None
 
             # Get recommendations from TFRS model
-            recommendations = self.model.recommend(
-                user_id=user_id,
-                k=k * 2,  # Get more để filter
-                filter_products=filter_products
-            )
+            if settings.request_batching_enabled:
+                recommendations = recommendation_batcher.submit(
+                    (user_id, _fetch_k(model, k), filter_products, history)
+                ).result(timeout=settings.request_batch_timeout_s)
+            else:
+                recommendations = model.recommend_batch(
+                    user_ids=[user_id],
+                    k=_fetch_k(model, k),
+                    filter_products=[filter_products],
+                    histories=_fold_in_histories([history])
+                )[0]
 
             # Return top k after filtering
             return recommendations[:k]
@@ -155,8 +351,107 @@ class TFRSRecommendationService:
             logger.error(f"Error getting recommendations: {e}", exc_info=True)
             return self._get_popular_fallback(k)
 
+    async def get_recommendations_async(
+        self,
+        user_id: str,
+        k: int = 10,
+        filter_viewed: bool = True
+    ) -> List[Tuple[str, float]]:
+        """
+        Async version của get_recommendations cho FastAPI handlers
+        Redis qua AsyncRedisService, model query qua batcher (không block event loop)
+        """
+        model = self.model
+
+        if not model.is_trained:
+            logger.warning("Model not trained. Returning popular products.")
+            return await self._get_popular_fallback_async(k)
+
+        try:
+            # Get user history để filter (và fold-in nếu user chưa có trong model)
+            history = None
+            filter_products = None
+            if filter_viewed:
+                history = await self.async_redis.get_user_history(user_id, limit=100)
+                filter_products = set(history) if history else None
+
+            # Get recommendations from TFRS model
+            if settings.request_batching_enabled:
+                future = recommendation_batcher.submit(
+                    (user_id, _fetch_k(model, k), filter_products, history)
+                )
+                recommendations = await asyncio.wait_for(
+                    asyncio.wrap_future(future),
+                    timeout=settings.request_batch_timeout_s
+                )
+            else:
+                results = await run_in_threadpool(
+                    model.recommend_batch,
+                    user_ids=[user_id],
+                    k=_fetch_k(model, k),
+                    filter_products=[filter_products],
+                    histories=_fold_in_histories([history])
+                )
+                recommendations = results[0]
+
+            # Return top k after filtering
+            return recommendations[:k]
+
+        except Exception as e:
+            logger.error(f"Error getting recommendations: {e}", exc_info=True)
+            return await self._get_popular_fallback_async(k)
+
+    def get_recommendations_batch(
+        self,
+        user_ids: List[str],
+        k: int = 10,
+        filter_viewed: bool = True
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Get recommendations cho nhiều users bằng một lần query model
+        History của tất cả users được lấy trong một Redis pipeline
+        """
+        model = self.model
+
+        if not model.is_trained:
+            logger.warning("Model not trained. Returning popular products.")
+            popular = self._get_popular_fallback(k)
+            return {user_id: list(popular) for user_id in user_ids}
+
+        try:
+            histories = [None] * len(user_ids)
+            filter_products = [None] * len(user_ids)
+            if filter_viewed:
+                user_histories = self.redis.get_user_histories(user_ids, limit=100)
+                histories = [user_histories.get(user_id) or None for user_id in user_ids]
+                filter_products = [set(history) if history else None for history in histories]
+
+            results = model.recommend_batch(
+                user_ids=user_ids,
+                k=_fetch_k(model, k),
+                filter_products=filter_products,
+                histories=_fold_in_histories(histories)
+            )
+
+            return {user_id: recs[:k] for user_id, recs in zip(user_ids, results)}
+
+        except Exception as e:
+            logger.error(f"Error getting batch recommendations: {e}", exc_info=True)
+            popular = self._get_popular_fallback(k)
+            return {user_id: list(popular) for user_id in user_ids}
+
     def _get_popular_fallback(self, k: int = 10) -> List[Tuple[str, float]]:
-        """Fallback to popular products"""
-        popular_ids = self.redis.get_popular_products(limit=k)
+        """Fallback to popular products (memory, fallback Redis)"""
+        popular_ids = popularity_refresher.popular_ids(k)
+        if popular_ids is None:
+            popular_ids = self.redis.get_popular_products(limit=k)
+
+        return [(pid, 0.5) for pid in popular_ids]
+
+    async def _get_popular_fallback_async(self, k: int = 10) -> List[Tuple[str, float]]:
+        """Fallback to popular products (async)"""
+        popular_ids = popularity_refresher.popular_ids(k)
+        if popular_ids is None:
+            popular_ids = await self.async_redis.get_popular_products(limit=k)
 
-        return [(pid, 0.5) for pid in popular_ids]
\ No newline at end of file
+        return [(pid, 0.5) for pid in popular_ids]
@@ -0,0 +1,348 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.model_registry import model_registry
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingAlreadyRunning(Exception):
+    """Đã có một training job đang chạy"""
+
+
+class TrainingCancelled(Exception):
+    """Training bị cancel qua cancel endpoint"""
+
+
+def _run_training_job(job_id: str, epochs: int, incremental: bool, progress_queue, cancel_event):
+    """
+    Entry point của training process
+    Chạy trong process riêng nên TensorFlow fit không tranh GIL/CPU với serving
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    import tensorflow as tf
+    from app.services.tfrs_service import TFRSRecommendationService
+
+    class ProgressCallback(tf.keras.callbacks.Callback):
+        """Báo progress từng epoch về process cha và dừng khi bị cancel"""
+
+        def __init__(self):
+            super().__init__()
+            self.examples = 0
+            self.train_started_at = None
+
+        def on_train_begin(self, logs=None):
+            self.train_started_at = time.monotonic()
+            progress_queue.put({'type': 'phase', 'phase': 'training'})
+
+        def on_train_batch_end(self, batch, logs=None):
+            # Batch cuối có thể nhỏ hơn batch_size, examples chỉ là xấp xỉ
+            self.examples += settings.training_batch_size
+
+            if cancel_event.is_set():
+                raise TrainingCancelled()
+
+        def on_epoch_end(self, epoch, logs=None):
+            elapsed = time.monotonic() - self.train_started_at
+            progress_queue.put({
+                'type': 'epoch',
+                'epoch': epoch + 1,
+                'loss': float((logs or {}).get('loss', 0.0)),
+                'examples': self.examples,
+                'examples_per_second': self.examples / elapsed if elapsed > 0 else 0.0
+            })
+
+        def on_train_end(self, logs=None):
+            progress_queue.put({'type': 'phase', 'phase': 'indexing'})
+
+    progress_queue.put({'type': 'phase', 'phase': 'collecting_data'})
+
+    try:
+        service = TFRSRecommendationService()
+        success = service.train_model(
+            epochs=epochs,
+            callbacks=[ProgressCallback()],
+            incremental=incremental,
+            # Shards riêng theo job, không đụng shards của job khác
+            data_dir=os.path.join(settings.training_data_dir, job_id)
+        )
+
+        # Precompute cho users active để serving chủ yếu chỉ là một cache read
+        precomputed = 0
+        if success and settings.precompute_after_training and not cancel_event.is_set():
+            progress_queue.put({'type': 'phase', 'phase': 'precomputing'})
+            try:
+                precomputed = service.precompute_recommendations()
+            except Exception as e:
+                logger.error(f"Precompute failed: {e}", exc_info=True)
+
+        progress_queue.put({'type': 'result', 'success': success, 'precomputed_users': precomputed})
+    except Exception as e:
+        progress_queue.put({'type': 'result', 'success': False, 'error': str(e)})
+
+
+class TrainingJobManager:
+    """
+    Quản lý training jobs chạy ngoài serving process
+
+    - Mỗi job chạy trong một process riêng (spawn)
+    - Chỉ cho phép một job chạy tại một thời điểm trên tất cả workers/replicas
+      (Redis lock SET NX EX, được gia hạn trong lúc job chạy)
+    - Job state chỉ nằm trong memory của worker đã start job, các workers khác
+      không thấy job đó (GET /jobs/{job_id} trả về 404)
+    - Progress (epoch, loss, examples/sec) được gửi về qua multiprocessing.Queue
+    - Job thành công thì model mới được load từ disk và swap vào ModelRegistry
+    """
+
+    MAX_FINISHED_JOBS = 20
+    TERMINATE_TIMEOUT_S = 5.0
+    LOCK_KEY = "training:lock"
+
+    def __init__(self):
+        self.redis = RedisService()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._jobs: Dict[str, Dict] = {}
+        self._cancel_events: Dict[str, object] = {}
+        self._active_job_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def start_job(self, epochs: int, incremental: bool = False) -> Dict:
+        """Start training job mới, raise TrainingAlreadyRunning nếu đang có job chạy"""
+        with self._lock:
+            if self._active_job_id:
+                raise TrainingAlreadyRunning(self._active_job_id)
+
+            job_id = str(uuid.uuid4())
+            if not self.redis.client.set(self.LOCK_KEY, job_id, nx=True, ex=settings.training_lock_ttl_s):
+                # Job đang chạy ở worker/replica khác
+                raise TrainingAlreadyRunning(self.redis.client.get(self.LOCK_KEY) or "unknown")
+
+            progress_queue = self._ctx.Queue()
+            cancel_event = self._ctx.Event()
+
+            process = self._ctx.Process(
+                target=_run_training_job,
+                args=(job_id, epochs, incremental, progress_queue, cancel_event),
+                name=f"training-{job_id[:8]}",
+                daemon=True
+            )
+
+            job = {
+                'job_id': job_id,
+                'status': 'running',
+                'phase': 'starting',
+                'epochs': epochs,
+                'incremental': incremental,
+                'current_epoch': 0,
+                'loss': None,
+                'examples': 0,
+                'examples_per_second': 0.0,
+                'started_at': time.time(),
+                'finished_at': None,
+                'model_version': None,
+                'precomputed_users': 0,
+                'error': None
+            }
+
+            try:
+                process.start()
+            except Exception:
+                self._release_lock(job_id)
+                raise
+
+            self._jobs[job_id] = job
+            self._cancel_events[job_id] = cancel_event
+            self._active_job_id = job_id
+            self._prune_finished_jobs()
+
+        threading.Thread(
+            target=self._monitor,
+            args=(job_id, process, progress_queue, cancel_event),
+            name=f"training-monitor-{job_id[:8]}",
+            daemon=True
+        ).start()
+
+        logger.info(f"Started training job {job_id} (pid {process.pid}, {epochs} epochs)")
+        return self.get_job(job_id)
+
+    def cancel_job(self, job_id: str) -> bool:
+        """Yêu cầu dừng job, returns False nếu job không còn chạy"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job['status'] != 'running':
+                return False
+
+            job['status'] = 'cancelling'
+            job['cancel_requested_at'] = time.time()
+            self._cancel_events[job_id].set()
+
+        logger.info(f"Cancel requested for training job {job_id}")
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+
+            job = dict(job)
+
+        end = job['finished_at'] or time.time()
+        job['elapsed_seconds'] = round(end - job['started_at'], 2)
+        return job
+
+    def active_job(self) -> Optional[Dict]:
+        job_id = self._active_job_id
+        return self.get_job(job_id) if job_id else None
+
+    def _refresh_lock(self, job_id: str):
+        """Gia hạn training lock nếu vẫn do job này giữ"""
+        def refresh(pipe):
+            if pipe.get(self.LOCK_KEY) == job_id:
+                pipe.multi()
+                pipe.expire(self.LOCK_KEY, settings.training_lock_ttl_s)
+
+        self.redis.client.transaction(refresh, self.LOCK_KEY)
+
+    def _release_lock(self, job_id: str):
+        """Xoá training lock nếu vẫn do job này giữ (lock đã hết hạn thì có thể job khác đang giữ)"""
+        def release(pipe):
+            if pipe.get(self.LOCK_KEY) == job_id:
+                pipe.multi()
+                pipe.delete(self.LOCK_KEY)
+
+        self.redis.client.transaction(release, self.LOCK_KEY)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _handle_message(self, job_id: str, message: Dict) -> Optional[bool]:
+        """Cập nhật job từ message của training process, trả về kết quả nếu là message 'result'"""
+        if message['type'] == 'phase':
+            self._update(job_id, phase=message['phase'])
+        elif message['type'] == 'epoch':
+            self._update(
+                job_id,
+                current_epoch=message['epoch'],
+                loss=message['loss'],
+                examples=message['examples'],
+                examples_per_second=round(message['examples_per_second'], 1)
+            )
+        elif message['type'] == 'result':
+            if message.get('error'):
+                self._update(job_id, error=message['error'])
+            self._update(job_id, precomputed_users=message.get('precomputed_users', 0))
+            return message['success']
+        return None
+
+    def _monitor(self, job_id: str, process, progress_queue, cancel_event):
+        """Theo dõi training process tới khi kết thúc"""
+        success = False
+        terminated = False
+        lock_refreshed_at = time.monotonic()
+
+        while True:
+            if time.monotonic() - lock_refreshed_at > settings.training_lock_ttl_s / 3:
+                try:
+                    self._refresh_lock(job_id)
+                    lock_refreshed_at = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Failed to refresh training lock: {e}")
+
+            try:
+                result = self._handle_message(job_id, progress_queue.get(timeout=0.5))
+                if result is not None:
+                    success = result
+                continue
+            except queue.Empty:
+                pass
+
+            if not process.is_alive():
+                break
+
+            # Process không dừng kịp sau khi cancel (vd: đang collect data) thì terminate một lần,
+            # vẫn còn sống sau TERMINATE_TIMEOUT_S thì kill
+            if cancel_event.is_set() and not terminated:
+                requested_at = self._jobs[job_id].get('cancel_requested_at', time.time())
+                if time.time() - requested_at > settings.training_cancel_grace_s:
+                    logger.warning(f"Training job {job_id} did not stop in time, terminating")
+                    process.terminate()
+                    process.join(self.TERMINATE_TIMEOUT_S)
+                    if process.is_alive():
+                        logger.warning(f"Training job {job_id} still running after SIGTERM, killing")
+                        process.kill()
+                    terminated = True
+
+        process.join()
+
+        # Đọc nốt messages còn lại trong queue
+        while True:
+            try:
+                result = self._handle_message(job_id, progress_queue.get_nowait())
+                if result is not None:
+                    success = result
+            except queue.Empty:
+                break
+
+        # Cancel tới sau khi fit xong thì model vẫn được save, coi như completed
+        if success:
+            status = 'completed'
+        elif cancel_event.is_set():
+            status = 'cancelled'
+        else:
+            status = 'failed'
+
+        version = None
+        if status == 'completed':
+            # Training process đã save model, load lại và swap vào serving ngay
+            # (các serving process khác tự reload qua ModelRegistry.start_watching)
+            if model_registry.reload():
+                version = model_registry.version
+            else:
+                status = 'failed'
+                self._update(job_id, error="Trained model could not be loaded")
+
+        with self._lock:
+            self._jobs[job_id].update(
+                status=status,
+                phase='done',
+                finished_at=time.time(),
+                model_version=version,
+                exit_code=process.exitcode
+            )
+            if not success and status == 'failed' and not self._jobs[job_id]['error']:
+                self._jobs[job_id]['error'] = f"Training process exited with code {process.exitcode}"
+            self._active_job_id = None
+            self._cancel_events.pop(job_id, None)
+
+        try:
+            self._release_lock(job_id)
+        except Exception as e:
+            # Lock tự hết hạn sau training_lock_ttl_s
+            logger.error(f"Failed to release training lock: {e}")
+
+        logger.info(f"Training job {job_id} finished with status {status}")
+
+    def _prune_finished_jobs(self):
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None
+        ]
+        for job_id in finished[:-self.MAX_FINISHED_JOBS]:
+            del self._jobs[job_id]
+
+
+training_jobs = TrainingJobManager()
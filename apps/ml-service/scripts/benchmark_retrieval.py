@@ -0,0 +1,93 @@
+"""
+Benchmark retrieval backends trên synthetic catalog
+
+So sánh IVF (approximate) với exact brute force (NumpyTopKIndex cho ranking
+giống hệt tfrs BruteForce): recall@k và latency p50/p99 cho single-user query
+
+Usage:
+    python scripts/benchmark_retrieval.py
+    python scripts/benchmark_retrieval.py --sizes 10000,100000 --probes 8,16,32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models.retrieval import IVFTopKIndex, NumpyTopKIndex  # noqa: E402
+
+
+def make_catalog(num_items: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Item embeddings dạng Gaussian mixture, gần với output thật của item tower"""
+    num_clusters = max(16, num_items // 1000)
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, num_items)
+    noise = 0.5 * rng.standard_normal((num_items, dim)).astype(np.float32)
+    return centers[labels] + noise
+
+
+def measure(index: NumpyTopKIndex, queries: np.ndarray, k: int):
+    """Chạy từng query một, trả về (product_ids, latencies_ms)"""
+    results = []
+    latencies = []
+
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.query_vectors(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+
+    return results, np.array(latencies)
+
+
+def recall_at_k(exact, approx) -> float:
+    hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact, approx)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--probes", default="8,16,32")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    probes = [int(p) for p in args.probes.split(",")]
+
+    print(f"{'items':>9} {'backend':>14} {'build_s':>8} {'recall@' + str(args.k):>9} {'p50_ms':>8} {'p99_ms':>8}")
+
+    for num_items in sizes:
+        items = make_catalog(num_items, args.dim, rng)
+        product_ids = np.array([f"p{i}" for i in range(num_items)])
+        # Queries lấy gần các items để giống user embeddings đã train
+        queries = items[rng.integers(0, num_items, args.queries)] + \
+            0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        no_users = np.zeros((1, args.dim), dtype=np.float32)
+
+        exact_index = NumpyTopKIndex(["[UNK]"], no_users, product_ids, items)
+        exact, latencies = measure(exact_index, queries, args.k)
+        print(f"{num_items:>9} {'exact':>14} {0.0:>8.2f} {1.0:>9.3f} "
+              f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}")
+
+        start = time.perf_counter()
+        ivf_index = IVFTopKIndex(["[UNK]"], no_users, product_ids, items)
+        build_seconds = time.perf_counter() - start
+
+        for num_probes in probes:
+            ivf_index.num_probes = min(num_probes, len(ivf_index.centroids))
+            approx, latencies = measure(ivf_index, queries, args.k)
+            name = f"ivf/{len(ivf_index.centroids)}/{num_probes}"
+            print(f"{num_items:>9} {name:>14} {build_seconds:>8.2f} {recall_at_k(exact, approx):>9.3f} "
+                  f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
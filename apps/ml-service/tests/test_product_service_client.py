@@ -0,0 +1,158 @@
+"""
+ProductServiceClient với Product Service giả (grpc.server in-process, implement
+GetProduct/GetProducts từ libs/proto product.proto)
+"""
+import threading
+import time
+from concurrent import futures
+
+import grpc
+import pytest
+
+from app.config import settings
+from app.services import product_service_client
+from app.services.product_service_client import ProductServiceClient, load_proto, product_cache
+
+pb2, pb2_grpc = load_proto()
+
+
+class FakeProductService(pb2_grpc.ProductServiceServicer):
+    """
+    - "missing": NOT_FOUND, "broken": INTERNAL, "slow": trả lời sau slow_s giây
+    - Ghi lại ids đã được gọi và số GetProduct in-flight lớn nhất
+    """
+
+    def __init__(self, delay_s: float = 0.0, slow_s: float = 1.0):
+        self.delay_s = delay_s
+        self.slow_s = slow_s
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def GetProduct(self, request, context):
+        with self._lock:
+            self.calls.append(request.id)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            time.sleep(self.slow_s if request.id == "slow" else self.delay_s)
+
+            if request.id == "missing":
+                context.abort(grpc.StatusCode.NOT_FOUND, "Product not found")
+            if request.id == "broken":
+                context.abort(grpc.StatusCode.INTERNAL, "Database error")
+
+            return pb2.GetProductResponse(
+                id=request.id,
+                name=f"Product {request.id}",
+                originalPrice=50.0,
+                brand=pb2.BrandResponse(id="b1"),
+                category=pb2.CategoryResponse(id="c1"),
+                skus=[pb2.SkuResponse(price=30.0), pb2.SkuResponse(price=20.0)]
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def GetProducts(self, request, context):
+        return pb2.GetAllProductsResponse(products=[
+            pb2.GetProductResponse(
+                id=f"{request.categoryId}-{i}",
+                category=pb2.CategoryResponse(id=request.categoryId),
+                originalPrice=10.0
+            )
+            for i in range(request.limit)
+        ])
+
+
+@pytest.fixture
+def product_service(monkeypatch):
+    servicer = FakeProductService()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=32))
+    pb2_grpc.add_ProductServiceServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+
+    monkeypatch.setattr(settings, "product_service_grpc_url", f"localhost:{port}")
+    monkeypatch.setattr(settings, "product_service_timeout_s", 0.5)
+    product_service_client.close_channel()
+    product_cache.clear()
+
+    yield servicer
+
+    product_service_client.close_channel()
+    product_cache.clear()
+    server.stop(None)
+
+
+@pytest.fixture
+def client(product_service):
+    client = ProductServiceClient()
+    client.connect()
+    return client
+
+
+def test_get_product(client):
+    assert client.get_product("p1") == {
+        'id': "p1",
+        'name': "Product p1",
+        'category_id': "c1",
+        'brand_id': "b1",
+        'price': 20.0
+    }
+
+
+def test_get_product_not_found(client, product_service):
+    assert client.get_product("missing") is None
+    assert client.get_product("broken") is None
+    assert product_service.calls == ["missing", "broken"]
+
+
+def test_get_product_uses_cache(client, product_service):
+    first = client.get_product("p1")
+    assert client.get_product("p1") == first
+    assert product_service.calls == ["p1"]
+
+
+def test_get_product_deadline(client):
+    started = time.monotonic()
+    assert client.get_product("slow") is None
+    assert time.monotonic() - started < 1.0
+
+
+def test_get_products_by_ids_chunks_calls(client, product_service, monkeypatch):
+    monkeypatch.setattr(settings, "product_service_batch_size", 4)
+    product_service.delay_s = 0.05
+    product_ids = [f"p{i}" for i in range(10)]
+
+    products = client.get_products_by_ids(product_ids)
+
+    assert [p['id'] for p in products] == product_ids
+    assert sorted(product_service.calls) == sorted(product_ids)
+    assert product_service.max_in_flight <= 4
+
+
+def test_get_products_by_ids_skips_errors(client):
+    products = client.get_products_by_ids(["p1", "missing", "broken", "slow", "p2"])
+    assert [p['id'] for p in products] == ["p1", "p2"]
+
+
+def test_get_products_by_ids_uses_cache(client, product_service):
+    client.get_product("p1")
+    client.search_products(category_id="c2", limit=2)
+
+    products = client.get_products_by_ids(["p1", "c2-0", "c2-1", "p2", "p2"])
+
+    assert sorted(p['id'] for p in products) == ["c2-0", "c2-1", "p1", "p2"]
+    assert product_service.calls == ["p1", "p2"]
+
+    client.get_products_by_ids(["p1", "p2"])
+    assert product_service.calls == ["p1", "p2"]
+
+
+def test_search_products(client):
+    products = client.search_products(category_id="c2", limit=3)
+    assert [p['id'] for p in products] == ["c2-0", "c2-1", "c2-2"]
+    assert all(p['category_id'] == "c2" and p['price'] == 10.0 for p in products)